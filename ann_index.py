@@ -0,0 +1,130 @@
+###################################################################################
+## @file      ann_index.py
+#  @brief     The ann_index.py holds an approximate nearest neighbour index (IVF) of
+#             the dense topic vectors (LDA, LSI, RP). The documents are clustered
+#             with k-means and every query is only scored against the documents of
+#             the nprobe clusters closest to it, instead of the whole corpus.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import numpy as np
+
+DEFAULT_NPROBE = 8 # clusters scored per query
+DEFAULT_ITERATIONS = 10 # k-means iterations
+TRAINING_POINTS_PER_LIST = 256 # documents sampled per cluster to train k-means
+
+#################################################################################
+## @brief   assign
+#  @details This method returns the closest centroid (highest cosine) of every vector.
+#  @param   vectors The L2-normalised vectors, one per row.
+#  @param   centroids The L2-normalised centroids, one per row.
+#  @param   chunksize The number of vectors compared with each product.
+#################################################################################
+def assign(vectors, centroids, chunksize=65536):
+    assignment = np.empty(vectors.shape[0], dtype=np.intp)
+    for start in range(0, vectors.shape[0], chunksize):
+        assignment[start:start + chunksize] = np.argmax(np.dot(vectors[start:start + chunksize], centroids.T), axis=1)
+    return assignment
+
+#################################################################################
+## @brief   kmeans
+#  @details This method clusters the vectors with spherical k-means: every vector is
+#           assigned to the closest centroid, and every centroid is the normalised
+#           sum of its vectors. The empty clusters keep their previous centroid.
+#  @param   vectors The L2-normalised vectors, one per row.
+#  @param   num_lists The number of clusters.
+#  @param   iterations The number of k-means iterations.
+#  @param   seed The seed of the random initial centroids.
+#################################################################################
+def kmeans(vectors, num_lists, iterations=DEFAULT_ITERATIONS, seed=0):
+    random = np.random.RandomState(seed)
+    centroids = np.array(vectors[random.choice(vectors.shape[0], num_lists, replace=False)], dtype=np.float32)
+    for iteration in range(iterations):
+        assignment = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.sqrt((sums * sums).sum(axis=1))
+        filled = norms > 0
+        centroids[filled] = sums[filled] / norms[filled, np.newaxis]
+    return centroids
+
+#################################################################################
+## @brief   recall_at_k
+#  @details This method returns the mean fraction of the exact top k documents that
+#           are retrieved by the approximate rankings.
+#  @param   exact The exact (ids, scores) rankings of the queries.
+#  @param   approximate The approximate (ids, scores) rankings of the queries.
+#  @param   k The number of documents compared.
+#################################################################################
+def recall_at_k(exact, approximate, k):
+    recalls = []
+    for (exact_ids, exact_scores), (ids, scores) in zip(exact, approximate):
+        expected = set(exact_ids[:k].tolist())
+        if len(expected) > 0:
+           recalls.append(len(expected.intersection(ids[:k].tolist())) / float(len(expected)))
+    return float(np.mean(recalls)) if len(recalls) > 0 else 1.0
+
+###################################################################################
+## @class   IVFIndex
+#  @brief   This class represents an inverted file index of dense vectors: the
+#           k-means centroids (coarse quantizer) and the sorted ids of the documents
+#           of each cluster. num_lists and nprobe trade recall for latency: more
+#           probed clusters score more documents and miss fewer neighbours.
+###################################################################################
+class IVFIndex(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @details This method trains the centroids on a sample of the vectors and
+    #           assigns every vector to its cluster.
+    #  @param   vectors The L2-normalised document vectors, one per row.
+    #  @param   num_lists The number of clusters (None uses sqrt(num_docs)).
+    #  @param   nprobe The number of clusters scored per query.
+    #  @param   iterations The number of k-means iterations.
+    #  @param   seed The seed of the k-means initialization and sampling.
+    #################################################################################
+    def __init__(self, vectors, num_lists=None, nprobe=DEFAULT_NPROBE, iterations=DEFAULT_ITERATIONS, seed=0):
+        if num_lists is None:
+           num_lists = int(np.sqrt(vectors.shape[0]))
+        num_lists = max(1, min(num_lists, vectors.shape[0]))
+        self.nprobe = nprobe
+        self.params = {'num_lists': num_lists, 'nprobe': nprobe, 'iterations': iterations, 'seed': seed}
+        sample = vectors
+        if vectors.shape[0] > num_lists * TRAINING_POINTS_PER_LIST:
+           random = np.random.RandomState(seed)
+           sample = vectors[np.sort(random.choice(vectors.shape[0], num_lists * TRAINING_POINTS_PER_LIST, replace=False))]
+        self.centroids = kmeans(np.asarray(sample, dtype=np.float32), num_lists, iterations, seed)
+        self.lists = [np.zeros(0, dtype=np.intp) for centroid in self.centroids]
+        self.vectors = vectors[:0]
+        self.add(vectors)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    #################################################################################
+    ## @brief   add
+    #  @details This method assigns the new vectors to the clusters, without training
+    #           the centroids again.
+    #  @param   vectors The matrix with all the document vectors; the rows beyond the
+    #           documents already indexed are the new documents.
+    #################################################################################
+    def add(self, vectors):
+        first_id = len(self)
+        self.vectors = vectors
+        assignment = assign(vectors[first_id:], self.centroids)
+        ids = np.arange(first_id, vectors.shape[0])
+        for cluster in np.unique(assignment):
+            self.lists[cluster] = np.concatenate([self.lists[cluster], ids[assignment == cluster]])
+
+    #################################################################################
+    ## @brief   candidates
+    #  @details This method returns the sorted ids of the documents of the nprobe
+    #           clusters closest to the query and their cosine with the query.
+    #  @param   query The L2-normalised dense query vector.
+    #  @param   nprobe The number of clusters scored (None uses the index default).
+    #################################################################################
+    def candidates(self, query, nprobe=None):
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = np.dot(self.centroids, query)
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        ids = np.sort(np.concatenate([self.lists[cluster] for cluster in probed]))
+        return ids, np.dot(self.vectors[ids], query)
@@ -0,0 +1,220 @@
+#!/usr/bin/python
+###################################################################################
+## @file      benchmark.py
+#  @brief     The benchmark.py measures the hot paths of the system on the bundled
+#             MED collection or on synthetic collections 10x-1000x larger: index
+#             build time, peak memory (RSS), latency percentiles and throughput (QPS)
+#             of the queries of every model, and the throughput of the evaluator.
+#             The results are written as JSON and they can be compared with a
+#             baseline (a previous result file) to flag regressions.
+#
+#             python benchmark.py --scale 1 10 --output results.json
+#             python benchmark.py --scale 1 10 --baseline results.json
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+import numpy as np
+import corpus_reader
+import ir_batch
+import ir_evaluator
+import ir_system
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+_worker_collection = None # collection of the benchmark process, set by the pool initializer
+
+# measure -> True if higher is better, for the comparison with the baseline
+MEASURES = {'build_seconds': False, 'peak_rss_mb': False, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'qps': True,
+            'runs_per_second': True}
+
+#################################################################################
+## @brief   synthetic_corpus
+#  @details This method generates a collection scale times larger than the given one,
+#           with the same word frequencies and document lengths: every document
+#           takes the length of a random document and its words are drawn from
+#           all the words of the collection.
+#  @param   corpus The documents of the collection.
+#  @param   scale The number of documents generated per document of the collection.
+#  @param   seed The seed of the random generator.
+#################################################################################
+def synthetic_corpus(corpus, scale, seed=0):
+    if scale == 1:
+       return list(corpus)
+    random = np.random.RandomState(seed)
+    documents = [doc.split() for doc in corpus]
+    words = np.array([word for words in documents for word in words])
+    lengths = np.array([len(words) for words in documents])
+    return [' '.join(words[random.randint(0, len(words), length)]) for length in lengths[random.randint(0, len(lengths), len(corpus) * scale)]]
+
+#################################################################################
+## @brief   peak_rss_mb
+#  @details This method returns the peak resident memory of the process in MB.
+#################################################################################
+def peak_rss_mb():
+    if resource is None:
+       return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+       return peak / 2.0 ** 20 # bytes
+    return peak / 2.0 ** 10 # kilobytes
+
+#################################################################################
+## @brief   search_function
+#  @details This method returns the function that ranks one query with the model.
+#  @param   ir The information retrieval system, with its index built.
+#  @param   corpus The documents of the collection.
+#  @param   top_k The number of documents ranked.
+#################################################################################
+def search_function(ir, corpus, top_k):
+    if isinstance(ir, ir_system.IRBoolean):
+       return lambda q: ir.process_operators(corpus, ir.preprocess_query(q), 0)
+    if isinstance(ir, ir_system.IR_BM25):
+       return lambda q: ir.bm25_ranking_function(corpus, q, 0, top_k)
+    return lambda q: ir.ranking_function(corpus, q, 0, ir.index, top_k)
+
+#################################################################################
+## @brief   benchmark_model
+#  @details This method builds the index of the model and ranks every query one at
+#           a time (one warm-up pass and then repeat measured passes). It is run in
+#           its own process, so the peak memory and the caches belong to the model.
+#  @param   model_class The class of the information retrieval system.
+#  @param   corpus The documents of the collection.
+#  @param   queries The queries.
+#  @param   top_k The number of documents ranked per query.
+#  @param   repeat The number of measured passes over the queries.
+#  @param   options The options of the information retrieval system (e.g. quantize).
+#################################################################################
+def benchmark_model(model_class, corpus, queries, top_k, repeat, options=None):
+    start = time.time()
+    ir = model_class(corpus, [], top_k=top_k, verbose=False, **(options or dict())) # the index is built, no query is launched
+    build_seconds = time.time() - start
+    search = search_function(ir, corpus, top_k)
+    for q in queries: # warm-up
+        search(q)
+    latencies = []
+    for iteration in range(repeat):
+        for q in queries:
+            start = time.time()
+            search(q)
+            latencies.append(time.time() - start)
+    latencies = np.array(latencies)
+    return {'build_seconds': build_seconds,
+            'peak_rss_mb': peak_rss_mb(),
+            'p50_ms': 1000 * float(np.percentile(latencies, 50)),
+            'p95_ms': 1000 * float(np.percentile(latencies, 95)),
+            'p99_ms': 1000 * float(np.percentile(latencies, 99)),
+            'qps': len(latencies) / max(float(latencies.sum()), 1e-9)}
+
+def _init_worker(collection):
+    global _worker_collection
+    _worker_collection = collection
+
+def _benchmark_model(model_class, queries, top_k, repeat, options):
+    return benchmark_model(model_class, _worker_collection, queries, top_k, repeat, options)
+
+#################################################################################
+## @brief   benchmark_evaluator
+#  @details This method measures how many runs (the rankings of all the queries)
+#           the evaluator measures per second.
+#  @param   qrels The relevance assessments.
+#  @param   ranking_query The ranking of documents of each query.
+#  @param   query_ids The ids of the queries.
+#  @param   runs The number of runs evaluated.
+#################################################################################
+def benchmark_evaluator(qrels, ranking_query, query_ids, runs=100):
+    ids = ir_evaluator.ranking_query_ids(ranking_query, query_ids=query_ids)
+    start = time.time()
+    for run in range(runs):
+        ir_evaluator.summarize(ir_evaluator.evaluate_rankings(qrels, ranking_query, ids))
+    return {'runs_per_second': runs / max(time.time() - start, 1e-9)}
+
+#################################################################################
+## @brief   compare
+#  @details This method compares the results with the baseline and returns the
+#           regressions: the measures worse than the baseline by more than the
+#           tolerance (a fraction of the baseline value).
+#  @param   results The results of the benchmark.
+#  @param   baseline The results of the baseline.
+#  @param   tolerance The allowed fraction of change.
+#################################################################################
+def compare(results, baseline, tolerance):
+    regressions = []
+    for scale, models in results['results'].items():
+        for name, measures in models.items():
+            expected = baseline.get('results', dict()).get(scale, dict()).get(name, dict())
+            for measure, value in measures.items():
+                reference = expected.get(measure)
+                if value is None or reference is None or reference == 0:
+                   continue
+                change = (value - reference) / float(reference)
+                if (MEASURES[measure] and change < -tolerance) or (not MEASURES[measure] and change > tolerance):
+                   regressions.append((scale, name, measure, reference, value, change))
+    return regressions
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the indexing, query and evaluation paths of the models.")
+    parser.add_argument('--corpus', default='corpus/MED.ALL', help="corpus file (default: corpus/MED.ALL)")
+    parser.add_argument('--queries', default='queries/MED.QRY', help="queries file (default: queries/MED.QRY)")
+    parser.add_argument('--qrels', default='relevance/MED.REL', help="relevance assessments (default: relevance/MED.REL)")
+    parser.add_argument('--scale', type=int, nargs='+', default=[1], help="sizes of the synthetic collections, times the corpus (default: 1)")
+    parser.add_argument('--models', nargs='+', default=['all'], help="names or ids of the models (default: all)")
+    parser.add_argument('--top-k', type=int, default=10, help="documents ranked per query (default: 10)")
+    parser.add_argument('--repeat', type=int, default=3, help="measured passes over the queries (default: 3)")
+    parser.add_argument('--quantize', choices=['float16', 'int8'], help="type of the weights of the dense indexes (default: float32)")
+    parser.add_argument('--compress-postings', action='store_true', help="compress the posting lists of the Boolean and BM25 models")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic collections (default: 0)")
+    parser.add_argument('--output', default='benchmark.json', help="JSON file of the results (default: benchmark.json)")
+    parser.add_argument('--baseline', help="JSON file of a previous result, to flag the regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed fraction of change with the baseline (default: 0.2)")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_arguments(argv)
+    models = ir_batch.select_models(args.models)
+    doc_ids, corpus = corpus_reader.read_corpus(args.corpus)
+    query_ids, queries = corpus_reader.read_corpus(args.queries)
+    results = {'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                               'processors': multiprocessing.cpu_count()},
+               'parameters': {'corpus': args.corpus, 'num_queries': len(queries), 'top_k': args.top_k, 'repeat': args.repeat,
+                              'seed': args.seed, 'quantize': args.quantize, 'compress_postings': args.compress_postings},
+               'results': dict()}
+    options = {'quantize': args.quantize, 'compress_postings': args.compress_postings}
+    for scale in args.scale:
+        collection = synthetic_corpus(corpus, scale, args.seed)
+        scale_results = dict()
+        for name, model_class in models:
+            pool = multiprocessing.Pool(1, _init_worker, (collection,)) # a new process per model
+            try:
+                scale_results[name] = pool.apply(_benchmark_model, (model_class, queries, args.top_k, args.repeat, options))
+            finally:
+                pool.terminate()
+            measures = scale_results[name]
+            print("%5dx %-14s build %8.2f s  rss %7.1f MB  p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms  %8.1f queries/s" % (scale, name,
+                  measures['build_seconds'], measures['peak_rss_mb'] or 0, measures['p50_ms'], measures['p95_ms'], measures['p99_ms'], measures['qps']))
+        results['results'][str(scale)] = scale_results
+    if args.qrels is not None and 1 in args.scale: # the relevance assessments belong to the real collection
+       qrels = ir_evaluator.read_qrels(args.qrels, doc_ids)
+       ir = ir_system.IR_tf_idf(corpus, queries, top_k=1000, batch=True, verbose=False)
+       results['results']['1']['evaluator'] = benchmark_evaluator(qrels, ir.ranking_query, query_ids)
+       print("evaluator %8.1f runs/s" % results['results']['1']['evaluator']['runs_per_second'])
+    with open(args.output, 'w') as output_file:
+         json.dump(results, output_file, indent=2, sort_keys=True)
+    if args.baseline is not None:
+       with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+       for scale, name, measure, reference, value, change in regressions:
+           print("REGRESSION %sx %s %s: %.3f -> %.3f (%+.0f%%)" % (scale, name, measure, reference, value, 100 * change))
+       if len(regressions) > 0:
+          return 1
+       print("No regressions with respect to " + args.baseline)
+    return 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,140 @@
+###################################################################################
+## @file      bm25.py
+#  @brief     The bm25.py ranks the documents with the Okapi BM25 function over the
+#             posting lists of the inverted index. The top k documents are computed
+#             exactly with MaxScore dynamic pruning, i.e., without scoring the
+#             documents that cannot enter the top k.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from collections import Counter
+import inverted_index
+import numpy as np
+import heapq
+import math
+
+###################################################################################
+## @class   BM25Scorer
+#  @brief   This class represents the BM25 ranking function. The inverse document
+#           frequency and the upper bound of the score of every term (its best score
+#           in any document) are computed once.
+###################################################################################
+class BM25Scorer(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   index The inverted index of the corpus.
+    #  @param   k1 The term frequency saturation parameter.
+    #  @param   b The document length normalization parameter.
+    #################################################################################
+    def __init__(self, index, k1=1.2, b=0.75):
+        self.index = index
+        self.k1 = k1
+        self.b = b
+        num_docs = index.num_docs
+        avg_length = float(sum(index.doc_lengths)) / max(1, num_docs)
+        # k1 * (1 - b + b * |d| / avgdl) of every document
+        self.length_norms = [k1 * (1 - b + b * length / max(avg_length, 1e-9)) for length in index.doc_lengths]
+        self.weights = [] # idf * (k1 + 1) of every term
+        self.upper_bounds = []
+        for term_id in range(len(index.doc_freqs)):
+            postings, frequencies = index.term_lists(term_id)
+            df = len(postings)
+            weight = math.log(1 + (num_docs - df + 0.5) / (df + 0.5)) * (k1 + 1)
+            self.weights.append(weight)
+            self.upper_bounds.append(max([self.term_score(weight, tf, doc) for doc, tf in zip(postings, frequencies)] or [0.0]))
+
+    #################################################################################
+    ## @brief   term_score
+    #  @details This method returns the BM25 score of a term in a document.
+    #  @param   weight The inverse document frequency of the term times k1 + 1.
+    #  @param   tf The frequency of the term in the document.
+    #  @param   doc The id of the document.
+    #################################################################################
+    def term_score(self, weight, tf, doc):
+        return weight * (float(tf) / (tf + self.length_norms[doc]))
+
+    #################################################################################
+    ## @brief   top_k
+    #  @details This method returns the ids and scores of the k best documents for the
+    #           query, sorted by decreasing score (ties by increasing id), with the
+    #           MaxScore algorithm. The terms are sorted by their upper bound; the
+    #           terms whose accumulated upper bounds cannot beat the k-th best score
+    #           (non-essential terms) do not generate candidates and they are only
+    #           looked up while the candidate can still enter the top k.
+    #  @param   terms_list The preprocessed terms of the query.
+    #  @param   k The number of documents returned, or None for every matching document.
+    #################################################################################
+    def top_k(self, terms_list, k=None):
+        if k is None:
+           k = self.index.num_docs
+        terms = []
+        for term, count in sorted(Counter(terms_list).items()):
+            term_id = self.index.token2id.get(term)
+            if term_id is not None and self.index.doc_freqs[term_id] > 0:
+               terms.append((self.upper_bounds[term_id] * count, self.weights[term_id] * count, term_id))
+        terms.sort()
+        num_terms = len(terms)
+        term_lists = [self.index.term_lists(term_id) for bound, weight, term_id in terms]
+        postings = [term_postings for term_postings, term_frequencies in term_lists]
+        frequencies = [term_frequencies for term_postings, term_frequencies in term_lists]
+        weights = [weight for bound, weight, term_id in terms]
+        sentinel = self.index.num_docs
+        positions = [0] * num_terms
+        current = [term_postings[0] for term_postings in postings] # current document of every term
+        bounds = [] # accumulated upper bounds of the terms with lower bound
+        total = 0.0
+        for bound, weight, term_id in terms:
+            total += bound
+            bounds.append(total)
+        length_norms = self.length_norms
+        heap = [] # (score, -doc) of the k best documents, the worst at the root
+        threshold = 0.0
+        first_essential = 0
+        while first_essential < num_terms and k > 0:
+            doc = min(current[first_essential:]) # next candidate of the essential terms
+            if doc == sentinel:
+               break
+            norm = length_norms[doc]
+            score = 0.0
+            for i in range(first_essential, num_terms):
+                if current[i] == doc:
+                   tf = frequencies[i][positions[i]]
+                   score += weights[i] * (float(tf) / (tf + norm))
+                   positions[i] += 1
+                   current[i] = postings[i][positions[i]] if positions[i] < len(postings[i]) else sentinel
+            for i in range(first_essential - 1, -1, -1): # non-essential terms, highest bound first
+                if len(heap) == k and score + bounds[i] <= threshold:
+                   break # the document cannot enter the top k
+                if current[i] < doc:
+                   positions[i] = inverted_index.gallop(postings[i], doc, positions[i])
+                   current[i] = postings[i][positions[i]] if positions[i] < len(postings[i]) else sentinel
+                if current[i] == doc:
+                   tf = frequencies[i][positions[i]]
+                   score += weights[i] * (float(tf) / (tf + norm))
+            if len(heap) < k:
+               heapq.heappush(heap, (score, -doc))
+            elif score > threshold: # equal scores keep the document with lower id
+               heapq.heapreplace(heap, (score, -doc))
+            if len(heap) == k:
+               threshold = heap[0][0]
+               while first_essential < num_terms and bounds[first_essential] <= threshold:
+                   first_essential += 1
+        ranking = sorted(heap, reverse=True)
+        ids = np.array([-doc for score, doc in ranking], dtype=np.intp)
+        scores = np.array([score for score, doc in ranking], dtype=np.float64)
+        return ids, scores
+
+    #################################################################################
+    ## @brief   score_all
+    #  @details This method returns the BM25 score of the query with every document,
+    #           scoring every posting (without pruning).
+    #  @param   terms The preprocessed terms of the query.
+    #################################################################################
+    def score_all(self, terms):
+        scores = np.zeros(self.index.num_docs)
+        for term, count in sorted(Counter(terms).items()):
+            term_id = self.index.token2id.get(term)
+            if term_id is not None:
+               for doc, tf in zip(*self.index.term_lists(term_id)):
+                   scores[doc] += self.term_score(self.weights[term_id] * count, tf, doc)
+        return scores
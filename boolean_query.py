@@ -0,0 +1,211 @@
+###################################################################################
+## @file      boolean_query.py
+#  @brief     The boolean_query.py parses the Boolean queries (AND, OR, NOT and
+#             parentheses) into a syntax tree and evaluates it over the inverted
+#             index, intersecting the rarest posting lists first.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import inverted_index
+import re
+
+TOKEN_PATTERN = re.compile(r"\(|\)|\w+", re.UNICODE)
+
+OPERATORS = ('and', 'or', 'not')
+
+#################################################################################
+## @brief   tokenize
+#  @details This method splits the query into words, operators and parentheses.
+#           The rest of the punctuation is ignored. Operators are lower-cased.
+#  @param   q Query written in Natural Language
+#################################################################################
+def tokenize(q):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(q):
+        if token.lower() in OPERATORS:
+           token = token.lower()
+        tokens.append(token)
+    return tokens
+
+###################################################################################
+## @class   TermNode
+#  @brief   This class represents a keyword of the query, i.e., a posting list.
+###################################################################################
+class TermNode(object):
+
+    def __init__(self, term):
+        self.term = term
+
+    def estimate(self, index):
+        return index.document_frequency(self.term)
+
+    def evaluate(self, index):
+        return index.term_postings(self.term)
+
+    def __repr__(self):
+        return self.term
+
+###################################################################################
+## @class   OrNode
+#  @brief   This class represents the disjunction of its children.
+###################################################################################
+class OrNode(object):
+
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, index):
+        return min(index.num_docs, sum(child.estimate(index) for child in self.children))
+
+    def evaluate(self, index):
+        return inverted_index.union([child.evaluate(index) for child in self.children])
+
+    def __repr__(self):
+        return '(' + ' OR '.join(repr(child) for child in self.children) + ')'
+
+###################################################################################
+## @class   NotNode
+#  @brief   This class represents the negation of its child.
+###################################################################################
+class NotNode(object):
+
+    def __init__(self, child):
+        self.child = child
+
+    def estimate(self, index):
+        return index.num_docs - self.child.estimate(index)
+
+    def evaluate(self, index):
+        return inverted_index.difference(index.all_documents(), self.child.evaluate(index))
+
+    def __repr__(self):
+        return 'NOT ' + repr(self.child)
+
+###################################################################################
+## @class   AndNode
+#  @brief   This class represents the conjunction of its children. The planner
+#           evaluates the positive children from the smallest estimated posting
+#           list to the largest, stops as soon as the result is empty and then
+#           removes the documents of the negated children.
+###################################################################################
+class AndNode(object):
+
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, index):
+        return min(child.estimate(index) for child in self.children)
+
+    def plan(self, index):
+        positives = [child for child in self.children if not isinstance(child, NotNode)]
+        negatives = [child.child for child in self.children if isinstance(child, NotNode)]
+        positives.sort(key=lambda child: child.estimate(index)) # rarest first
+        return positives, negatives
+
+    def evaluate(self, index):
+        positives, negatives = self.plan(index)
+        if len(positives) == 0:
+           result = index.all_documents()
+        else:
+           result = positives[0].evaluate(index)
+           for child in positives[1:]:
+               if len(result) == 0:
+                  return result # short-circuit, the remaining children are not evaluated
+               result = inverted_index.intersect([result, child.evaluate(index)])
+        for child in negatives:
+            if len(result) == 0:
+               break
+            result = inverted_index.difference(result, child.evaluate(index))
+        return result
+
+    def __repr__(self):
+        return '(' + ' AND '.join(repr(child) for child in self.children) + ')'
+
+###################################################################################
+## @class   BooleanQueryParser
+#  @brief   This class builds the syntax tree of a query with the grammar
+#               or_expr  := and_expr ( OR and_expr )*
+#               and_expr := not_expr ( [AND] not_expr )*
+#               not_expr := NOT not_expr | atom
+#               atom     := word | '(' or_expr ')'
+#           Consecutive words are joined with AND, which binds tighter than OR.
+#           Words are preprocessed with the analyzer and stopwords are dropped.
+#           Unbalanced parentheses are tolerated, since queries are written in
+#           Natural Language.
+###################################################################################
+class BooleanQueryParser(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   analyzer The text analyzer used to preprocess the words.
+    #################################################################################
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    #################################################################################
+    ## @brief   parse
+    #  @details This method returns the syntax tree of the query, or None if the
+    #           query has no keywords. A stray closing parenthesis is skipped and
+    #           the rest of the query is joined with OR, e.g. "(a)) or b" is a OR b.
+    #  @param   q Query written in Natural Language
+    #################################################################################
+    def parse(self, q):
+        self.tokens = tokenize(q)
+        self.pos = 0
+        children = [self.parse_or()]
+        while self.pos < len(self.tokens): # stray closing parenthesis, skipped
+            self.pos += 1
+            children.append(self.parse_or()) # the rest of the query is another disjunct
+        return self.join(OrNode, children)
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+           return self.tokens[self.pos]
+        return None
+
+    def join(self, node_class, children):
+        children = [child for child in children if child is not None]
+        if len(children) == 0:
+           return None
+        if len(children) == 1:
+           return children[0]
+        return node_class(children)
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.pos += 1
+            children.append(self.parse_and())
+        return self.join(OrNode, children)
+
+    def parse_and(self):
+        children = []
+        while self.peek() not in (None, 'or', ')'):
+            if self.peek() == 'and':
+               self.pos += 1
+               continue
+            children.append(self.parse_not())
+        return self.join(AndNode, children)
+
+    def parse_not(self):
+        if self.peek() == 'not':
+           self.pos += 1
+           if self.peek() in (None, 'or', ')'):
+              return None # NOT without operand
+           child = self.parse_not()
+           if child is None:
+              return None
+           return NotNode(child)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.peek()
+        self.pos += 1
+        if token == '(':
+           node = self.parse_or()
+           if self.peek() == ')':
+              self.pos += 1
+           return node
+        if token == 'and':
+           return None
+        terms = self.analyzer.analyze(token)
+        return self.join(AndNode, [TermNode(term) for term in terms])
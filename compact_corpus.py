@@ -0,0 +1,132 @@
+###################################################################################
+## @file      compact_corpus.py
+#  @brief     The compact_corpus.py stores the bag-of-words of the documents in three
+#             flat arrays (CSR layout): indptr (where the terms of every document
+#             start), indices (term ids, int32) and data (term counts, int32). A
+#             term of a document takes 8 bytes instead of a Python (id, count) tuple
+#             in a list. The documents are still returned as lists of (token_id,
+#             token_count) 2-tuples, so the corpus can be given to the gensim models.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import numpy as np
+import scipy.sparse
+
+CHUNK_SIZE = 4096 # documents converted at a time
+
+###################################################################################
+## @class   CompactCorpus
+#  @brief   This class represents the bag-of-words corpus in CSR layout. It can be
+#           indexed by document id and iterated as many times as needed; documents
+#           are appended at the end.
+###################################################################################
+class CompactCorpus(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   vectors The documents in bag-of-words format (any iterable).
+    #################################################################################
+    def __init__(self, vectors=()):
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.int32)
+        self.extend(vectors)
+
+    #################################################################################
+    ## @brief   from_matrix
+    #  @details This method returns the corpus of the rows of a sparse matrix (the
+    #           arrays are shared when they have the right types).
+    #  @param   matrix The documents x terms matrix of counts.
+    #################################################################################
+    @classmethod
+    def from_matrix(cls, matrix):
+        matrix = scipy.sparse.csr_matrix(matrix)
+        matrix.sort_indices()
+        corpus = cls()
+        corpus.indptr = matrix.indptr.astype(np.int64, copy=False)
+        corpus.indices = matrix.indices.astype(np.int32, copy=False)
+        corpus.data = matrix.data.astype(np.int32, copy=False)
+        return corpus
+
+    #################################################################################
+    ## @brief   extend
+    #  @details This method appends the documents. They are converted by chunks, so a
+    #           streamed corpus is never held as Python tuples.
+    #  @param   vectors The documents in bag-of-words format.
+    #################################################################################
+    def extend(self, vectors):
+        indptr, indices, data = [self.indptr], [self.indices], [self.data]
+        last, chunk = self.indptr[-1], []
+        for vector in vectors:
+            chunk.append(vector)
+            if len(chunk) == CHUNK_SIZE:
+               last = self.append_chunk(chunk, last, indptr, indices, data)
+               chunk = []
+        if len(chunk) > 0:
+           self.append_chunk(chunk, last, indptr, indices, data)
+        if len(indptr) > 1:
+           self.indptr = np.concatenate(indptr)
+           self.indices = np.concatenate(indices)
+           self.data = np.concatenate(data)
+
+    def append_chunk(self, chunk, last, indptr, indices, data):
+        lengths = np.array([len(vector) for vector in chunk], dtype=np.int64)
+        pairs = np.array([pair for vector in chunk for pair in vector], dtype=np.int64).reshape(-1, 2)
+        indptr.append(last + np.cumsum(lengths))
+        indices.append(pairs[:, 0].astype(np.int32))
+        data.append(pairs[:, 1].astype(np.int32))
+        return indptr[-1][-1]
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    #################################################################################
+    ## @brief   __getitem__
+    #  @details This method returns the document as a list of (token_id, token_count)
+    #           2-tuples.
+    #  @param   doc The id of the document.
+    #################################################################################
+    def __getitem__(self, doc):
+        start, end = self.indptr[doc], self.indptr[doc + 1]
+        return list(zip(self.indices[start:end].tolist(), self.data[start:end].tolist()))
+
+    def __iter__(self):
+        for first in range(0, len(self), CHUNK_SIZE):
+            bounds = self.indptr[first:first + CHUNK_SIZE + 1]
+            indices = self.indices[bounds[0]:bounds[-1]].tolist()
+            data = self.data[bounds[0]:bounds[-1]].tolist()
+            offsets = (bounds - bounds[0]).tolist()
+            for start, end in zip(offsets[:-1], offsets[1:]):
+                yield list(zip(indices[start:end], data[start:end]))
+
+    #################################################################################
+    ## @brief   nnz
+    #  @details This method returns the number of (document, term) pairs.
+    #################################################################################
+    def nnz(self):
+        return int(self.indptr[-1])
+
+    #################################################################################
+    ## @brief   matrix
+    #  @details This method returns the documents x terms CSR matrix of counts (the
+    #           arrays are shared, not copied).
+    #  @param   num_terms The number of columns (terms of the dictionary).
+    #################################################################################
+    def matrix(self, num_terms=None):
+        if num_terms is None:
+           num_terms = int(self.indices.max()) + 1 if len(self.indices) > 0 else 0
+        return scipy.sparse.csr_matrix((self.data, self.indices, self.indptr), shape=(len(self), num_terms))
+
+    #################################################################################
+    ## @brief   select
+    #  @details This method returns the corpus with the given documents, in order.
+    #  @param   docs The ids of the documents kept.
+    #################################################################################
+    def select(self, docs):
+        return CompactCorpus.from_matrix(self.matrix()[np.asarray(docs, dtype=np.intp)])
+
+    #################################################################################
+    ## @brief   nbytes
+    #  @details This method returns the memory of the arrays of the corpus in bytes.
+    #################################################################################
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
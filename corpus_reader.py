@@ -0,0 +1,150 @@
+###################################################################################
+## @file      corpus_reader.py
+#  @brief     The corpus_reader.py streams the documents of a collection as
+#             (doc_id, text) records, one document at a time, from MED-style files
+#             (.I id, .W text), JSON lines files and their gzip versions. The
+#             dictionary and the bag-of-words corpus are built from the stream,
+#             so the texts of the collection do not need to fit in memory.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from gensim import corpora
+import codecs
+import gzip
+import io
+import json
+import re
+import compact_corpus
+
+FIELD_MARKER = re.compile(r'^\.([A-Z])(?:\s+(.*))?$') # .I 12, .W, .T, ...
+
+#################################################################################
+## @brief   open_text
+#  @details This method opens a text file (UTF-8) for reading, decompressing it if
+#           its name ends with .gz.
+#  @param   path The path of the file.
+#################################################################################
+def open_text(path):
+    if path.endswith('.gz'):
+       return codecs.getreader('utf-8')(gzip.open(path, 'rb'))
+    return io.open(path, encoding='utf-8')
+
+#################################################################################
+## @brief   read_med
+#  @details This method yields the (doc_id, text) records of a MED-style file. Every
+#           record starts with a ".I id" line; the text is the content of its fields
+#           (.W, and .T or .A if there are any). The ids are kept as in the file;
+#           a ".I" line without id gets the number of the record, from 1.
+#  @param   path The path of the file.
+#################################################################################
+def read_med(path):
+    doc_id, lines, in_text, number = None, [], False, 0
+    with open_text(path) as med_file:
+         for line in med_file:
+             marker = FIELD_MARKER.match(line.rstrip('\r\n'))
+             if marker is not None and marker.group(1) == 'I':
+                if doc_id is not None:
+                   yield doc_id, u''.join(lines)
+                number += 1
+                doc_id, lines, in_text = (marker.group(2) or u'%d' % number).strip(), [], False
+             elif marker is not None:
+                in_text = True # a new field of the document
+             elif in_text:
+                lines.append(line)
+    if doc_id is not None:
+       yield doc_id, u''.join(lines)
+
+#################################################################################
+## @brief   read_jsonl
+#  @details This method yields the (doc_id, text) records of a JSON lines file, one
+#           JSON object per line. The documents without id are numbered from 1.
+#  @param   path The path of the file.
+#  @param   id_field The field of the document id.
+#  @param   text_field The field of the document text.
+#################################################################################
+def read_jsonl(path, id_field='id', text_field='text'):
+    with open_text(path) as jsonl_file:
+         number = 0
+         for line in jsonl_file:
+             if line.strip():
+                number += 1
+                record = json.loads(line)
+                yield u'%s' % record.get(id_field, number), record[text_field]
+
+###################################################################################
+## @class   CorpusReader
+#  @brief   This class represents a collection on disk. It can be iterated as many
+#           times as needed (every pass reads the file again) and it yields the
+#           (doc_id, text) records; the format is chosen by the file name.
+###################################################################################
+class CorpusReader(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   path The path of the collection: MED-style, or JSON lines if the name
+    #           ends with .jsonl or .jsonl.gz.
+    #  @param   id_field The field of the document id (JSON lines).
+    #  @param   text_field The field of the document text (JSON lines).
+    #################################################################################
+    def __init__(self, path, id_field='id', text_field='text'):
+        self.path = path
+        self.id_field = id_field
+        self.text_field = text_field
+
+    def __iter__(self):
+        if self.path.endswith('.jsonl') or self.path.endswith('.jsonl.gz'):
+           return read_jsonl(self.path, self.id_field, self.text_field)
+        return read_med(self.path)
+
+    def ids(self):
+        return [doc_id for doc_id, text in self]
+
+    #################################################################################
+    ## @brief   texts
+    #  @details This method returns the texts of the collection, streamed from the
+    #           file every time they are iterated.
+    #################################################################################
+    def texts(self):
+        return CorpusTexts(self)
+
+###################################################################################
+## @class   CorpusTexts
+#  @brief   This class represents the texts of a collection on disk. It can be given
+#           to the information retrieval systems instead of a list of texts: it is 
+#           iterated as many times as needed and no text is kept in memory.
+###################################################################################
+class CorpusTexts(object):
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __iter__(self):
+        for doc_id, text in self.reader:
+            yield text
+
+#################################################################################
+## @brief   read_corpus
+#  @details This method returns the ids and the texts of the collection in two lists,
+#           for the code that needs the documents in memory.
+#  @param   path The path of the collection.
+#################################################################################
+def read_corpus(path):
+    ids, texts = [], []
+    for doc_id, text in CorpusReader(path):
+        ids.append(doc_id)
+        texts.append(text)
+    return ids, texts
+
+#################################################################################
+## @brief   build_bow
+#  @details This method builds the dictionary and the bag-of-words of the collection
+#           in one pass, preprocessing one document at a time: the keywords of a
+#           document are dropped once it is converted, and the bag-of-words is kept
+#           in the flat arrays of a CompactCorpus. The ids of the terms are the ids
+#           corpora.Dictionary would assign.
+#  @param   analyzer The text analyzer (tokenization, stopwords, stemming).
+#  @param   texts The texts of the collection (any iterable, e.g. CorpusTexts).
+#################################################################################
+def build_bow(analyzer, texts):
+    dictionary = corpora.Dictionary()
+    bow = compact_corpus.CompactCorpus(dictionary.doc2bow(analyzer.analyze(text), allow_update=True) for text in texts)
+    return dictionary, bow
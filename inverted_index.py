@@ -0,0 +1,245 @@
+###################################################################################
+## @file      inverted_index.py
+#  @brief     The inverted_index.py maps every term of the dictionary to the sorted
+#             list of documents that contain it (posting list) and evaluates the
+#             Boolean operators over the posting lists. The posting lists can be
+#             kept compressed (gaps between document ids and frequencies written as
+#             varints) and decoded when a query needs them.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from array import array
+from bisect import bisect_left
+import heapq
+import numpy as np
+import uuid
+import compact_corpus
+
+EMPTY_POSTINGS = array('I')
+
+#################################################################################
+## @brief   gallop
+#  @details This method returns the position of the first element of the posting
+#           list greater than or equal to doc_id, starting at position lo. The range
+#           is bounded by exponential steps and then bisected, so skipping k
+#           postings costs O(log k).
+#  @param   postings Sorted posting list.
+#  @param   doc_id The document id searched.
+#  @param   lo The position where the search starts.
+#################################################################################
+def gallop(postings, doc_id, lo):
+    step = 1
+    hi = lo
+    while hi < len(postings) and postings[hi] < doc_id:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(postings, doc_id, lo, min(hi, len(postings)))
+
+#################################################################################
+## @brief   intersect_pair
+#  @details This method intersects two posting lists by galloping through the
+#           longest one with the documents of the shortest one.
+#################################################################################
+def intersect_pair(short, long):
+    result = array('I')
+    pos = 0
+    for doc_id in short:
+        pos = gallop(long, doc_id, pos)
+        if pos == len(long):
+           break
+        if long[pos] == doc_id:
+           result.append(doc_id)
+    return result
+
+#################################################################################
+## @brief   intersect
+#  @details This method returns the documents contained in every posting list (AND).
+#           The lists are intersected from the shortest one and the evaluation
+#           stops as soon as the intersection is empty.
+#  @param   postings_lists The posting lists of the terms.
+#################################################################################
+def intersect(postings_lists):
+    if len(postings_lists) == 0:
+       return EMPTY_POSTINGS
+    postings_lists = sorted(postings_lists, key=len)
+    result = postings_lists[0]
+    for postings in postings_lists[1:]:
+        if len(result) == 0:
+           break
+        result = intersect_pair(result, postings)
+    return result
+
+#################################################################################
+## @brief   union
+#  @details This method returns the documents contained in any posting list (OR)
+#           with a k-way merge of the sorted lists.
+#  @param   postings_lists The posting lists of the terms.
+#################################################################################
+def union(postings_lists):
+    postings_lists = [postings for postings in postings_lists if len(postings) > 0]
+    if len(postings_lists) == 1:
+       return postings_lists[0]
+    result = array('I')
+    last = -1
+    for doc_id in heapq.merge(*postings_lists):
+        if doc_id != last:
+           result.append(doc_id)
+           last = doc_id
+    return result
+
+#################################################################################
+## @brief   difference
+#  @details This method returns the documents of the posting list that are not in
+#           the excluded posting list (AND NOT).
+#  @param   postings Sorted posting list.
+#  @param   excluded Sorted posting list of the documents to be removed.
+#################################################################################
+def difference(postings, excluded):
+    if len(excluded) == 0:
+       return postings
+    result = array('I')
+    pos = 0
+    for doc_id in postings:
+        pos = gallop(excluded, doc_id, pos)
+        if pos == len(excluded) or excluded[pos] != doc_id:
+           result.append(doc_id)
+    return result
+
+#################################################################################
+## @brief   encode_varints
+#  @details This method writes the integers as varints: 7 bits per byte, from the
+#           lowest bits, with the high bit set in every byte but the last one. The
+#           integers below 128 take one byte.
+#  @param   values The non-negative integers (below 2^35).
+#################################################################################
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    num_bytes = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21, 28):
+        num_bytes += values >= (1 << bits)
+    ends = np.cumsum(num_bytes)
+    starts = ends - num_bytes
+    encoded = np.zeros(int(ends[-1]) if len(values) > 0 else 0, dtype=np.uint8)
+    for byte in range(5):
+        rows = np.flatnonzero(num_bytes > byte)
+        if len(rows) == 0:
+           break
+        more = (num_bytes[rows] > byte + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[rows] + byte] = ((values[rows] >> np.uint64(7 * byte)) & np.uint64(0x7f)) | more
+    return encoded
+
+#################################################################################
+## @brief   decode_varints
+#  @details This method reads the integers written by encode_varints.
+#  @param   encoded The bytes of the varints (uint8 array).
+#################################################################################
+def decode_varints(encoded):
+    if len(encoded) == 0:
+       return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(encoded < 0x80) # last byte of every integer
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shifts = 7 * (np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((encoded & 0x7f).astype(np.uint64) << shifts.astype(np.uint64), starts)
+
+###################################################################################
+## @class   InvertedIndex
+#  @brief   This class represents the inverted index of the corpus, i.e., the
+#           posting list of each term of the dictionary stored as a compact array
+#           of sorted document ids, with the frequency of the term in each document
+#           and the length (number of keywords) of each document. If it is
+#           compressed, the posting lists of all the terms are stored in one byte 
+#           array: the gaps between the document ids and then the frequencies of
+#           every term, as varints (about 2 bytes per posting instead of 8).
+###################################################################################
+class InvertedIndex(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @details This method builds the posting lists from the bag-of-words documents.
+    #           The documents x terms matrix is transposed, so the documents of every
+    #           term come out sorted.
+    #  @param   dictionary The dictionary with the documents keywords.
+    #  @param   bow The documents in bag-of-words format.
+    #  @param   compressed If True, the posting lists are compressed.
+    #################################################################################
+    def __init__(self, dictionary, bow, compressed=False):
+        self.token2id = dictionary.token2id
+        if not isinstance(bow, compact_corpus.CompactCorpus):
+           bow = compact_corpus.CompactCorpus(bow)
+        matrix = bow.matrix(len(dictionary))
+        self.num_docs = len(bow)
+        self.compressed = compressed
+        self.doc_lengths = array('I', np.asarray(matrix.sum(axis=1)).ravel().tolist())
+        matrix = matrix.tocsc()
+        matrix.sort_indices()
+        self.doc_freqs = np.diff(matrix.indptr) # number of documents of every term
+        if compressed:
+           starts = matrix.indptr[:-1]
+           gaps = matrix.indices.astype(np.int64)
+           gaps[1:] -= matrix.indices[:-1]
+           gaps[starts[self.doc_freqs > 0]] = matrix.indices[starts[self.doc_freqs > 0]] # first document of every term
+           term_starts = np.repeat(starts, self.doc_freqs) # the block of a term: gaps, then frequencies
+           positions = np.arange(len(gaps)) + term_starts
+           values = np.zeros(2 * len(gaps), dtype=np.int64)
+           values[positions] = gaps
+           values[positions + np.repeat(self.doc_freqs, self.doc_freqs)] = matrix.data
+           self.encoded = encode_varints(values)
+           value_ends = np.concatenate([[0], np.flatnonzero(self.encoded < 0x80) + 1]) # first byte of every value
+           self.offsets = value_ends[2 * matrix.indptr]
+        else:
+           doc_ids, counts, bounds = matrix.indices.astype(np.uint32), matrix.data.astype(np.uint32), matrix.indptr.tolist()
+           self.postings = [array('I', doc_ids[start:end].tobytes()) for start, end in zip(bounds[:-1], bounds[1:])] # copied as bytes, not Python ints
+           self.frequencies = [array('I', counts[start:end].tobytes()) for start, end in zip(bounds[:-1], bounds[1:])]
+        self.documents = array('I', range(self.num_docs))
+        self.uid = uuid.uuid4().hex # identity of the index for the query cache
+
+    #################################################################################
+    ## @brief   term_lists
+    #  @details This method returns the posting list of the term and the frequencies
+    #           of the term in its documents, decoding them if they are compressed.
+    #  @param   term_id The id of the term.
+    #################################################################################
+    def term_lists(self, term_id):
+        if not self.compressed:
+           return self.postings[term_id], self.frequencies[term_id]
+        values = decode_varints(self.encoded[self.offsets[term_id]:self.offsets[term_id + 1]])
+        doc_freq = int(self.doc_freqs[term_id])
+        return array('I', np.cumsum(values[:doc_freq]).tolist()), array('I', values[doc_freq:].tolist())
+
+    #################################################################################
+    ## @brief   term_postings
+    #  @details This method returns the posting list of the (preprocessed) term.
+    #  @param   term The term, i.e., a keyword of the taxonomy.
+    #################################################################################
+    def term_postings(self, term):
+        term_id = self.token2id.get(term)
+        if term_id is None:
+           return EMPTY_POSTINGS
+        return self.term_lists(term_id)[0]
+
+    #################################################################################
+    ## @brief   document_frequency
+    #  @details This method returns the number of documents of the (preprocessed) term,
+    #           without decoding its posting list.
+    #  @param   term The term, i.e., a keyword of the taxonomy.
+    #################################################################################
+    def document_frequency(self, term):
+        term_id = self.token2id.get(term)
+        if term_id is None:
+           return 0
+        return int(self.doc_freqs[term_id])
+
+    #################################################################################
+    ## @brief   all_documents
+    #  @details This method returns the posting list with every document.
+    #################################################################################
+    def all_documents(self):
+        return self.documents
+
+    #################################################################################
+    ## @brief   match_all
+    #  @details This method returns the documents that contain all the terms.
+    #  @param   terms The preprocessed terms of the query.
+    #################################################################################
+    def match_all(self, terms):
+        return intersect([self.term_postings(term) for term in set(terms)])
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+###################################################################################
+## @file      ir_batch.py
+#  @brief     The ir_batch.py runs every query against every requested model without
+#             prompts and writes one TREC run file per model. The corpus is
+#             preprocessed once and shared by all the models (and the inverted index
+#             by the Boolean and BM25 models); with an index directory, it is only
+#             preprocessed if an index has to be built. If the relevance assessments are given,
+#             the runs are evaluated and the report is written with the run files.
+#
+#             python ir_batch.py --corpus corpus/MED.ALL --queries queries/MED.QRY
+#                                --qrels relevance/MED.REL --models tf_idf bm25
+#                                --top-k 1000 --output-dir runs/
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import argparse
+import os
+import sys
+import time
+import corpus_reader
+import ir_evaluator
+import ir_index
+import ir_system
+import rocchio_algorithm
+
+# model name -> (id of the model, class of the information retrieval system)
+MODELS = [('boolean', 0, ir_system.IRBoolean), ('tf', 1, ir_system.IR_tf), ('tf_idf', 2, ir_system.IR_tf_idf),
+          ('lda', 3, ir_system.IR_Lda), ('lda_multicore', 4, ir_system.IR_Lda_Multicore), ('lsi', 5, ir_system.IR_Lsi),
+          ('rp', 6, ir_system.IR_Rp), ('log_entropy', 7, ir_system.IR_LogEntropyModel), ('bm25', 8, ir_system.IR_BM25)]
+
+#################################################################################
+## @brief   select_models
+#  @details This method returns the (name, class) of the requested models, given by
+#           name or by id, in the order of the menu.
+#  @param   requested The names or ids of the models ('all' selects every model).
+#################################################################################
+def select_models(requested):
+    if 'all' in requested:
+       return [(name, model_class) for name, model_id, model_class in MODELS]
+    selected = []
+    for name, model_id, model_class in MODELS:
+        if name in requested or str(model_id) in requested:
+           selected.append((name, model_class))
+    unknown = set(requested) - set([name for name, model_id, model_class in MODELS] + [str(model_id) for name, model_id, model_class in MODELS])
+    if len(unknown) > 0:
+       raise ValueError("Unknown models: " + ", ".join(sorted(unknown)))
+    return selected
+
+#################################################################################
+## @brief   write_run
+#  @details This method writes the rankings in TREC run format: query id, Q0,
+#           document id, rank, score and run tag per line, with the ids of the 
+#           query and corpus files.
+#  @param   path The path of the run file.
+#  @param   ranking_query The ranking of documents of each query.
+#  @param   run_tag The name of the run.
+#  @param   query_ids The ids of the queries, in file order.
+#  @param   doc_ids The ids of the documents, in corpus order.
+#  @param   top_k Number of documents written per query (None writes all of them).
+#################################################################################
+def write_run(path, ranking_query, run_tag, query_ids, doc_ids, top_k=None):
+    with open(path, 'w') as run_file:
+         for query in sorted(ranking_query):
+             for rank, (doc, score) in enumerate(ranking_query[query][:top_k]):
+                 run_file.write("%s Q0 %s %d %.6f %s\n" % (query_ids[query], doc_ids[doc], rank + 1, score, run_tag))
+
+#################################################################################
+## @brief   run_models
+#  @details This method runs the queries with every model and writes the run files.
+#           With pseudo-relevance feedback, the queries of the vector models are 
+#           expanded with their top documents and ranked again in a second pass over
+#           the same index, which is written as another run (name_prf).
+#           It returns the (name, ranking_query, seconds) of every run.
+#  @param   corpus Set of documents to be processed.
+#  @param   queries List of queries written in Natural Language.
+#  @param   models The (name, class) of the models.
+#  @param   output_dir The directory of the run files.
+#  @param   query_ids The ids of the queries, in file order.
+#  @param   doc_ids The ids of the documents, in corpus order.
+#  @param   prf_docs The number of top documents of the pseudo-relevance feedback
+#           (0 does not run it).
+#  @param   options The options of the information retrieval systems.
+#################################################################################
+def run_models(corpus, queries, models, output_dir, query_ids, doc_ids, prf_docs=0, **options):
+    if not os.path.exists(output_dir):
+       os.makedirs(output_dir)
+    corpus_view = ir_system.LazyCorpusView(corpus, **options) # preprocessed at most once for all the models
+    options['corpus_view'] = corpus_view
+    shared = ir_system.IRSystem(corpus, queries, **options)
+    inverted_index = None
+    runs = []
+    for name, model_class in models:
+        start = time.time()
+        preprocessed = corpus_view.view is not None
+        if model_class in (ir_system.IRBoolean, ir_system.IR_BM25):
+           if inverted_index is None:
+              inverted_index = shared.build_inverted_index(corpus)
+           ir = model_class(corpus, queries, index=inverted_index, **options)
+        else:
+           ir = model_class(corpus, queries, **options)
+        seconds = time.time() - start
+        if not preprocessed and corpus_view.view is not None: # this model preprocessed the corpus
+           print("%-14s %8.2f s" % ('preprocessing', corpus_view.seconds))
+           seconds -= corpus_view.seconds
+        write_run(os.path.join(output_dir, name + '.run'), ir.ranking_query, name, query_ids, doc_ids, options.get('top_k'))
+        print("%-14s %8.2f s  %8.1f queries/s" % (name, seconds, len(queries) / max(seconds, 1e-9)))
+        runs.append((name, ir.ranking_query, seconds))
+        if prf_docs > 0 and isinstance(getattr(ir, 'index', None), ir_index.IRIndex):
+           start = time.time()
+           rankings = rocchio_algorithm.pseudo_relevance_feedback(ir, queries, ir.ranking_query, prf_docs, top_k=options.get('top_k'))
+           prf_seconds = time.time() - start
+           ranking_query = dict((query, list(zip(ids.tolist(), scores.tolist()))) for query, (ids, scores) in enumerate(rankings))
+           write_run(os.path.join(output_dir, name + '_prf.run'), ranking_query, name + '_prf', query_ids, doc_ids, options.get('top_k'))
+           print("%-14s %8.2f s  %8.2f ms/query added by the feedback" % (name + '_prf', prf_seconds, 1000 * prf_seconds / max(len(queries), 1)))
+           runs.append((name + '_prf', ranking_query, seconds + prf_seconds))
+    return runs
+
+#################################################################################
+## @brief   parse_arguments
+#  @details This method parses the arguments of the command line.
+#  @param   argv The arguments of the command line.
+#################################################################################
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Run the queries with the information retrieval models and write TREC run files.")
+    parser.add_argument('--corpus', required=True, help="corpus file (MED format or JSON lines, optionally gzipped)")
+    parser.add_argument('--queries', required=True, help="queries file (MED format or JSON lines, optionally gzipped)")
+    parser.add_argument('--qrels', help="relevance assessments (MED.REL format); the runs are evaluated if it is given")
+    parser.add_argument('--models', nargs='+', default=['all'],
+                        help="names or ids of the models: " + ", ".join("%s (%d)" % (name, model_id) for name, model_id, model_class in MODELS))
+    parser.add_argument('--top-k', type=int, default=1000, help="documents ranked per query (default: 1000)")
+    parser.add_argument('--output-dir', default='runs', help="directory of the run files and of the report (default: runs)")
+    parser.add_argument('--index-dir', help="directory where the indexes are stored and reloaded from")
+    parser.add_argument('--processes', type=int, default=1, help="processes used to preprocess the corpus, which is then read in memory (default: 1, streamed)")
+    parser.add_argument('--prf', type=int, default=0, metavar='K',
+                        help="pseudo-relevance feedback: expand the queries of the vector models with their top K documents (default: 0, off)")
+    parser.add_argument('--backend', default='auto', choices=['auto', 'dense', 'sparse', 'sharded'], help="similarity backend (default: auto)")
+    parser.add_argument('--quantize', choices=['float16', 'int8'], help="type of the weights of the dense indexes (default: float32)")
+    parser.add_argument('--compress-postings', action='store_true', help="compress the posting lists of the Boolean and BM25 models")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_arguments(argv)
+    try:
+        models = select_models(args.models)
+    except ValueError as error:
+        print(str(error))
+        return 2
+    if args.processes > 1: # the documents are sharded across the processes
+       doc_ids, corpus = corpus_reader.read_corpus(args.corpus)
+    else:
+       reader = corpus_reader.CorpusReader(args.corpus)
+       doc_ids, corpus = reader.ids(), reader.texts() # the texts are streamed from the file
+    query_ids, queries = corpus_reader.read_corpus(args.queries)
+    runs = run_models(corpus, queries, models, args.output_dir, query_ids, doc_ids, args.prf, top_k=args.top_k, batch=True, index_dir=args.index_dir,
+                      processes=args.processes, backend=args.backend, quantize=args.quantize, compress_postings=args.compress_postings,
+                      verbose=False)
+    if args.qrels is not None:
+       qrels = ir_evaluator.read_qrels(args.qrels, doc_ids)
+       metrics = [(name, ir_evaluator.evaluate_rankings(qrels, ranking_query, ir_evaluator.ranking_query_ids(ranking_query, query_ids=query_ids)))
+                  for name, ranking_query, seconds in runs]
+       for name, summary in ir_evaluator.write_report(metrics, args.output_dir):
+           print("%-14s MAP = %.3f  P@10 = %.3f  nDCG@10 = %.3f" % (name, summary['MAP'], summary['P@10'], summary['nDCG@10']))
+    return 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
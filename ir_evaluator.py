@@ -1,163 +1,290 @@
 import matplotlib.pyplot as plot
 import os
+import json
 import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+RECALL_LEVELS = np.array([ 0. ,  0.1,  0.2,  0.3,  0.4,  0.5,  0.6,  0.7,  0.8,  0.9,  1. ]) # standard recall levels
+
+#################################################################################
+## @brief   read_qrels
+#  @details This method reads the relevance assessments file (MED.REL format: query
+#           id, 0, document id, 1 per line).
+#  @param   path The path of the relevance assessments file.
+#  @param   doc_ids The ids of the documents of the corpus, in corpus order.
+#################################################################################
+def read_qrels(path, doc_ids=None):
+    with open(path) as qrels_file:
+         return Qrels([line.split() for line in qrels_file if line.strip()], doc_ids)
+
+###################################################################################
+## @class   Qrels
+#  @brief   This class represents the relevance assessments indexed by query: the
+#           sorted array of relevant documents of each query. The queries keep the
+#           ids of MED.REL, while the documents are converted to the ids of the
+#           rankings, i.e., the position of the document in the corpus (from 0).
+###################################################################################
+class Qrels(object):
 
-class IREvaluator(object):
-    """description of class"""
     #################################################################################
     ## @brief   Constructor
-    #  @details This method initializes the class with:
-    #           relevance_docs It contains relevance assessments for each query in MED.QRY
-    #           ranking_query  The ranking documents for each query
-    #################################################################################    
-    def __init__(self,relevance_docs,ranking_query,continue_eval,only_query_id):
-        self.relevance_docs=relevance_docs        
-        self.continue_eval=continue_eval
-       
-        query_id=1
-        if len(ranking_query) >1: 
-           for q in ranking_query-1:
-               print("\n-------------------------->Query = " + str(query_id) ) 
-               relevants_docs_query=self.get_total_relevant_docs(query_id)
-               ranking_query[q] = [ranking_query[q][i] for i in range(len(ranking_query[q])) if ranking_query[q][i][1] > 0.0] 
-               self.evaluate_query(ranking_query[q],relevants_docs_query,query_id)
-               query_id += 1
-        else:
-            print("\n-------------------------->Query = " + str(only_query_id) ) 
-            relevants_docs_query=self.get_total_relevant_docs(only_query_id)
-            ranking_query[1] = [ranking_query[1][i] for i in range(len(ranking_query[1])) if ranking_query[1][i][1] > 0.0] 
-            self.evaluate_query(ranking_query[1],relevants_docs_query,only_query_id)
-
+    #  @param   rows The relevance assessments, one [query id, 0, document id, 1]
+    #           row per relevant document (as strings or integers).
+    #  @param   doc_ids The ids of the documents of the corpus (e.g. the .I ids), in 
+    #           corpus order, or None if the documents are numbered from 1.
+    #################################################################################
+    def __init__(self, rows, doc_ids=None):
+        positions = None
+        if doc_ids is not None:
+           positions = dict((str(doc_id), position) for position, doc_id in enumerate(doc_ids))
+        relevant = dict()
+        for row in rows:
+            if positions is None:
+               relevant.setdefault(int(row[0]), []).append(int(row[2]) - 1) # documents are numbered from 1 in MED.REL
+            elif str(row[2]) in positions:
+               relevant.setdefault(int(row[0]), []).append(positions[str(row[2])])
+        self.relevant = dict((query_id, np.unique(docs)) for query_id, docs in relevant.items())
 
-   #################################################################################
-    ## @brief   evaluate_query
-    #  @details This method computes the precision and recall for the provided query
-    #  @param   ranking Ranking result for each query
-    #  @param   relevance_docs It contains relevance assessments for each query in MED.QRY
-    #  @param   query_id Query id
-    #################################################################################    
-    def evaluate_query(self,ranking,relevants_docs_query,query_id):
-        if(self.continue_eval):
-            [true_positives, false_positives] = self.relevant_doc_retrieved(query_id,ranking,relevants_docs_query)
+    #################################################################################
+    ## @brief   relevant_docs
+    #  @details This method returns the sorted ids of the relevant documents of a query.
+    #  @param   query_id The id of the query in the relevance assessments.
+    #################################################################################
+    def relevant_docs(self, query_id):
+        return self.relevant.get(query_id, np.zeros(0, dtype=np.intp))
 
-            recall = self.get_recall(true_positives,len(relevants_docs_query[query_id]))
-            precision = self.get_precision(true_positives,false_positives)
+#################################################################################
+## @brief   ranking_query_ids
+#  @details This method returns the id in the relevance assessments of every query
+#           of the rankings. The queries of a list are ranked with ids from 0, in
+#           the order of MED.QRY, and they are evaluated as the ids of the query 
+#           file (numbered from 1 if they are not given), while a single query is 
+#           ranked with id 1 and it is evaluated as the query id given by the user.
+#  @param   ranking_query The ranking of documents of each query.
+#  @param   only_query_id The id of the single query, or None.
+#  @param   query_ids The ids of the queries (e.g. the .I ids), in file order.
+#################################################################################
+def ranking_query_ids(ranking_query, only_query_id=None, query_ids=None):
+    if only_query_id is not None and list(ranking_query.keys()) == [1]:
+       return {1: int(only_query_id)}
+    if query_ids is not None:
+       return dict((query, int(query_ids[query])) for query in ranking_query)
+    return dict((query, query + 1) for query in ranking_query)
 
-            # compute total precision and recall
-            print(" Precision: " + str(precision) + "\n")
-            print(" Recall:  "  +  str(recall) + "\n") 
+#################################################################################
+## @brief   relevance_matrix
+#  @details This method returns the boolean matrix (queries x ranks) of the relevant
+#           documents of the rankings. The membership of every ranked document is
+#           tested at once by numbering the (query, document) pairs.
+#  @param   rankings The arrays of ranked document ids of the queries.
+#  @param   relevant The sorted arrays of relevant document ids of the queries.
+#  @param   depth The number of ranks of the matrix.
+#################################################################################
+def relevance_matrix(rankings, relevant, depth):
+    rankings = [np.asarray(ids, dtype=np.int64)[:depth] for ids in rankings]
+    matrix = np.zeros((len(rankings), depth), dtype=bool)
+    if len(rankings) == 0:
+       return matrix
+    lengths = np.array([len(ids) for ids in rankings])
+    stride = 1 + max([int(ids.max()) for ids in rankings + list(relevant) if len(ids) > 0] or [0])
+    rows = np.repeat(np.arange(len(rankings)), lengths)
+    ranks = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    ranked_pairs = rows * stride + np.concatenate(rankings + [np.zeros(0, dtype=np.int64)])
+    relevant_pairs = np.concatenate([row * stride + np.asarray(docs, dtype=np.int64) for row, docs in enumerate(relevant)])
+    matrix[rows, ranks] = np.isin(ranked_pairs, relevant_pairs)
+    return matrix
 
-            true_positives = 0
-            false_positives = 0
-            recall = []
-            precision = []
-            for doc in ranking:
-               if str(doc[0]) in relevants_docs_query[query_id]: # position 3 indicates document ID
-                    true_positives += 1
-               else:
-                    false_positives += 1
+#################################################################################
+## @brief   evaluate_rankings
+#  @details This method computes the evaluation measures of all the queries at once
+#           with cumulative sums over the relevance matrix: the precision and recall
+#           at every rank, the 11-point interpolated precision, the average
+#           precision, the precision at k, the R-precision and the nDCG at k. Only
+#           the documents with score > 0 are considered retrieved.
+#  @param   qrels The relevance assessments.
+#  @param   ranking_query The ranking of documents of each query: a list of
+#           (document id, score) pairs.
+#  @param   query_ids The id in the relevance assessments of every query.
+#  @param   k The cutoff of the precision and nDCG measures.
+#################################################################################
+def evaluate_rankings(qrels, ranking_query, query_ids, k=10):
+    queries = sorted(ranking_query)
+    rankings = [[doc for doc, score in ranking_query[query] if score > 0.0] for query in queries]
+    relevant = [qrels.relevant_docs(query_ids[query]) for query in queries]
+    num_relevant = np.array([len(docs) for docs in relevant])
+    depth = max([k, 1] + [len(ids) for ids in rankings] + num_relevant.tolist())
+    matrix = relevance_matrix(rankings, relevant, depth)
+    rows = np.arange(len(queries))
+    ranks = np.arange(1, depth + 1)
+    hits = np.cumsum(matrix, axis=1)
+    total = np.maximum(num_relevant, 1) # the queries without relevant documents score 0
+    precision = hits / ranks.astype(float)
+    recall = hits / total[:, np.newaxis].astype(float)
 
-               recall.append(self.get_recall(true_positives,len(relevants_docs_query[query_id])))
-               precision.append(self.get_precision(true_positives,false_positives))
+    # interpolated precision: best precision at any rank with recall >= level, i.e.,
+    # from the first rank with ceil(level * R) relevant documents
+    best_precision = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+    needed = np.ceil(RECALL_LEVELS[np.newaxis, :] * num_relevant[:, np.newaxis] - 1e-9).astype(np.int64)
+    offsets = rows[:, np.newaxis] * (depth + 1) # hits <= depth, so the rows do not overlap
+    first_rank = np.searchsorted((hits + offsets).ravel(), (needed + offsets).ravel()).reshape(needed.shape) - rows[:, np.newaxis] * depth
+    interpolated = np.where(first_rank < depth, best_precision[rows[:, np.newaxis], np.minimum(first_rank, depth - 1)], 0.0)
+    interpolated[num_relevant == 0] = 0.0
 
+    discounts = 1.0 / np.log2(ranks + 1)
+    ideal = np.cumsum(discounts)[np.minimum(total, k) - 1]
+    return {'query_ids': np.array([query_ids[query] for query in queries]),
+            'num_relevant': num_relevant,
+            'precision': precision,
+            'recall': recall,
+            'interpolated_precision': interpolated,
+            'average_precision': (precision * matrix).sum(axis=1) / total,
+            'precision_at_k': hits[:, k - 1] / float(k),
+            'r_precision': hits[rows, total - 1] / total.astype(float),
+            'ndcg_at_k': (matrix[:, :k] * discounts[:k]).sum(axis=1) / ideal}
 
-            recalls_levels = np.array([ 0. ,  0.1,  0.2,  0.3,  0.4,  0.5,  0.6,  0.7,  0.8,  0.9,  1. ]) 
+#################################################################################
+## @brief   summarize
+#  @details This method returns the mean of the measures over the queries with
+#           relevance assessments.
+#  @param   metrics The measures of every query (evaluate_rankings).
+#  @param   k The cutoff of the precision and nDCG measures.
+#################################################################################
+def summarize(metrics, k=10):
+    judged = metrics['num_relevant'] > 0
+    if not judged.any():
+       judged[:] = True
+    return {'num_queries': int(judged.sum()),
+            'MAP': float(metrics['average_precision'][judged].mean()),
+            'P@%d' % k: float(metrics['precision_at_k'][judged].mean()),
+            'R-precision': float(metrics['r_precision'][judged].mean()),
+            'nDCG@%d' % k: float(metrics['ndcg_at_k'][judged].mean()),
+            'interpolated_precision': metrics['interpolated_precision'][judged].mean(axis=0).tolist()}
 
-            interpolated_precisions = self.interpolate_precisions(recall,precision,recalls_levels)
-            self.plot_results(recalls_levels, interpolated_precisions)
-        else: # Show the final results
-            plot.show()
-            plot.close()
-               
-        return 
+#################################################################################
+## @brief   plot_run
+#  @details This method draws the interpolated P/R curve of every query of a run and
+#           the mean curve in a new figure, without the global pyplot state, so it 
+#           does not need a display.
+#  @param   name The name of the run.
+#  @param   metrics The measures of every query (evaluate_rankings).
+#  @param   summary The mean measures of the run (summarize).
+#################################################################################
+def plot_run(name, metrics, summary):
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    for precision in metrics['interpolated_precision']:
+        axes.plot(RECALL_LEVELS, precision, color='0.8', linewidth=0.8)
+    axes.plot(RECALL_LEVELS, summary['interpolated_precision'], color='b', linewidth=2, label='mean')
+    axes.set_xlabel('recall')
+    axes.set_ylabel('precision')
+    axes.set_ylim(0, 1.05)
+    axes.set_title('P/R curves: %s (MAP = %.3f)' % (name, summary['MAP']))
+    axes.legend()
+    return figure
 
+#################################################################################
+## @brief   write_report
+#  @details This method writes the evaluation of several runs in the output directory:
+#           pr_curves.pdf with the mean P/R curves of all the runs followed by one 
+#           page per run, and the mean measures in summary.json and summary.csv.
+#           It returns the summaries.
+#  @param   runs The list of (name, metrics) of the runs (evaluate_rankings).
+#  @param   output_dir The directory of the report.
+#  @param   k The cutoff of the precision and nDCG measures.
+#################################################################################
+def write_report(runs, output_dir, k=10):
+    if not os.path.exists(output_dir):
+       os.makedirs(output_dir)
+    summaries = [(name, summarize(metrics, k)) for name, metrics in runs]
+    pdf = PdfPages(os.path.join(output_dir, 'pr_curves.pdf'))
+    try:
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot(111)
+        for name, summary in summaries:
+            axes.plot(RECALL_LEVELS, summary['interpolated_precision'], label='%s (MAP = %.3f)' % (name, summary['MAP']))
+        axes.set_xlabel('recall')
+        axes.set_ylabel('precision')
+        axes.set_ylim(0, 1.05)
+        axes.set_title('Mean P/R curves')
+        axes.legend(fontsize='small')
+        pdf.savefig(figure)
+        for (name, metrics), (name, summary) in zip(runs, summaries):
+            pdf.savefig(plot_run(name, metrics, summary))
+    finally:
+        pdf.close()
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as json_file:
+         json.dump([dict(summary, model=name) for name, summary in summaries], json_file, indent=2, sort_keys=True)
+    columns = ['num_queries', 'MAP', 'P@%d' % k, 'R-precision', 'nDCG@%d' % k]
+    with open(os.path.join(output_dir, 'summary.csv'), 'w') as csv_file:
+         csv_file.write(','.join(['model'] + columns + ['P(R=%.1f)' % level for level in RECALL_LEVELS]) + '\n')
+         for name, summary in summaries:
+             values = [str(summary[column]) for column in columns] + [str(value) for value in summary['interpolated_precision']]
+             csv_file.write(','.join([name] + values) + '\n')
+    return summaries
 
+class IREvaluator(object):
+    """description of class"""
     #################################################################################
-    ## @brief   total_relevant_docs
-    #  @details This method returns the total relevant documents for a query.
-    #  @param   query_id The id of the query
-    #  @param   relevance_docs It contains relevance assessments for each query in MED.QRY
-    #################################################################################    
-    def relevant_doc_retrieved(self,query,ranking,relevants_docs_query):
-        true_positives = 0
-        false_positives = 0
-        for doc in ranking:
-           if str(doc[0]) in relevants_docs_query[query]: # position 3 indicates document ID
-                true_positives += 1
-           else:
-                false_positives += 1
-        return true_positives,false_positives
-
+    ## @brief   Constructor
+    #  @details This method initializes the class with:
+    #           relevance_docs It contains relevance assessments for each query in MED.QRY
+    #                          (a Qrels index, or the rows of MED.REL)
+    #           ranking_query  The ranking documents for each query
+    #           k              The cutoff of the precision and nDCG measures
+    #           query_ids      The ids of the queries (e.g. the .I ids), in file order,
+    #                          or None if they are numbered from 1
     #################################################################################
-    ## @brief   total_relevant_docs
-    #  @details This method returns the total relevant documents for a query.
-    #  @param   relevants_docs_query is a dictionary that stores the query key and the relevant documents IDs
-    #################################################################################    
-    def get_total_relevant_docs(self,query_id): 
-        relevants_query=dict()
-        relevants_docs_query=[] # stores the relevant docs for a query
-        for doc in self.relevance_docs:
-            if(doc[0]==query_id): # the position 0 contains the query ID
-              relevants_docs_query.append(doc[2]) # position 3 indicates document ID
-        relevants_query[query_id]=relevants_docs_query 
-        return relevants_query
-
+    def __init__(self,relevance_docs,ranking_query,continue_eval,only_query_id,k=10,query_ids=None):
+        if isinstance(relevance_docs, Qrels):
+           self.qrels=relevance_docs
+        else:
+           self.qrels=Qrels(relevance_docs)
+        self.continue_eval=continue_eval
+        self.k=k
+        self.query_ids=query_ids
+        self.evaluate_query(ranking_query,only_query_id)
 
+   #################################################################################
+    ## @brief   evaluate_query
+    #  @details This method computes the precision and recall for the provided queries,
+    #           prints them with the mean measures and plots the interpolated P/R
+    #           curve of every query.
+    #  @param   ranking_query Ranking result for each query
+    #  @param   only_query_id The id of the single query, or None
     #################################################################################
-    ## @brief   get_recall
-    #  @details A measure of the ability of a system to present all relevant items.
-    #  @param   true_positives retrieved documents correctly
-    #  @param   false_negatives retrieved documents incorrectly
-    #  @param   real_true_positives total of documents that are really relevant 
-    #################################################################################    
-    def get_recall(self,true_positives,real_true_positives):
-        recall=float(true_positives)/float(real_true_positives)
-        return recall
+    def evaluate_query(self,ranking_query,only_query_id):
+        if(self.continue_eval):
+            self.metrics = evaluate_rankings(self.qrels, ranking_query, ranking_query_ids(ranking_query, only_query_id, self.query_ids), self.k)
+            self.summary = summarize(self.metrics, self.k)
+            for row, query in enumerate(sorted(ranking_query)):
+                print("\n-------------------------->Query = " + str(self.metrics['query_ids'][row]) )
+                retrieved = len([doc for doc, score in ranking_query[query] if score > 0.0])
+                if retrieved > 0:
+                   print(" Precision: " + str(self.metrics['precision'][row, retrieved - 1]) + "\n")
+                   print(" Recall:  "  +  str(self.metrics['recall'][row, retrieved - 1]) + "\n")
+                print(" Average precision: " + "%.3f" % self.metrics['average_precision'][row] + "\n")
+                self.plot_results(RECALL_LEVELS, self.metrics['interpolated_precision'][row])
+            print("\n MAP = %.3f, P@%d = %.3f, R-precision = %.3f, nDCG@%d = %.3f\n" % (self.summary['MAP'],
+                  self.k, self.summary['P@%d' % self.k], self.summary['R-precision'], self.k, self.summary['nDCG@%d' % self.k]))
+        else: # Show the final results
+            plot.show()
+            plot.close()
 
-    #################################################################################
-    ## @brief   get_precision
-    #  @details A measure of the ability of a system to present only relevant items.
-    #  @param   true_positives retrieved documents correctly
-    #  @param   false_negatives retrieved documents incorrectly
-    #################################################################################    
-    def get_precision(self,true_positives,false_positives):
-        relevant_items_retrieved=true_positives+false_positives
-        precision=float(true_positives)/float(relevant_items_retrieved)
-        return precision
-    
-    #################################################################################
-    ## @brief   interpolate_precisions
-    #  @details individual topic precision values are interpolated to 
-    #           a set of standard recall levels (0 to 1 in increments of .1)
-    #  @param   recall retrieved documents correctly
-    #  @param   precision retrieved documents incorrectly
-    #  @param   recalls_levels the standard recall levels
-    ################################################################################# 
-    def interpolate_precisions(self,recalls,precisions, recalls_levels):
-        precisions_interpolated = np.zeros((len(recalls), len(recalls_levels)))
-        i = 0
-        while i < len(precisions):
-            # use the max precision obtained for the topic for any actual recall level greater than or equal the recall_levels
-            recalls_inter = np.where((recalls[i] > recalls_levels) == True)[0]
-            for recall_id in recalls_inter:
-                if precisions[i] > precisions_interpolated[i, recall_id]:
-                   precisions_interpolated[i, recall_id] = precisions[i]
-            i += 1
-
-        mean_interpolated_precisions = np.mean(precisions_interpolated, axis=0)
-        return mean_interpolated_precisions
+        return
 
     #################################################################################
     ## @brief   plot_results
     #  @details plot the result of evaluate each query
     #  @param   recall retrieved documents correctly
     #  @param   precision retrieved documents incorrectly
-    #################################################################################   
+    #################################################################################
     def plot_results(self,recall, precision):
         plot.plot(recall, precision)
         plot.xlabel('recall')
-        plot.ylabel('precision')       
+        plot.ylabel('precision')
         plot.draw()
         plot.title('P/R curves')
-   
\ No newline at end of file
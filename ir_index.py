@@ -0,0 +1,657 @@
+###################################################################################
+## @file      ir_index.py
+#  @brief     The ir_index.py holds the index built once per corpus and model: the
+#             dictionary, the weighted documents, the trained model and the
+#             similarity index used to score every query.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from gensim import corpora, matutils, models, similarities
+from gensim.models.tfidfmodel import precompute_idfs
+import numpy as np
+import scipy.sparse
+import copy
+import hashlib
+import itertools
+import json
+import os
+import uuid
+import ann_index
+import compact_corpus
+import quantization
+import sharded_index
+
+INDEX_FORMAT_VERSION = 4 # increase it when the layout of the index directory changes
+
+MODEL_NAMES = {1: 'tf', 2: 'tf_idf', 3: 'lda', 4: 'lda_multicore', 5: 'lsi', 6: 'rp', 7: 'log_entropy'}
+
+SPARSE_MODES = (1, 2, 7) # TF, TF-IDF and LogEntropy documents keep the sparsity of the corpus
+
+TOPIC_MODES = (3, 4, 5, 6) # LDA, LDA Multicore, LSI and RP models
+
+DENSITY_THRESHOLD = 0.05 # below this fraction of non-zero weights the sparse backend is used
+
+SIMILARITY_CLASSES = {'dense': similarities.MatrixSimilarity, 'sparse': similarities.SparseMatrixSimilarity}
+
+MODEL_CLASSES = {2: models.TfidfModel, 3: models.LdaModel, 4: models.LdaMulticore,
+                 5: models.LsiModel, 6: models.RpModel, 7: models.LogEntropyModel}
+
+#################################################################################
+## @brief   tf_weights
+#  @details This method returns the logarithmic TF weights of a bag-of-words vector.
+#  @param   vector List of (token_id, token_count) 2-tuples
+#################################################################################
+def tf_weights(vector):
+    return [(w[0], 1 + np.log2(w[1])) for w in vector]
+
+#################################################################################
+## @brief   top_k
+#  @details This method returns the ids and scores of the k best documents, sorted by
+#           decreasing score (ties by increasing id). Only the k winners are sorted,
+#           so the cost is O(n + k log k) instead of sorting every document.
+#  @param   scores The similarity of the query with every document.
+#  @param   k The number of documents returned, or None to return all of them.
+#  @param   drop_zeros If True, the documents with score 0 are not returned.
+#################################################################################
+def top_k(scores, k=None, drop_zeros=False):
+    scores = np.asarray(scores)
+    if drop_zeros:
+       ids = np.flatnonzero(scores > 0)
+    else:
+       ids = np.arange(len(scores))
+    if k is not None and k < len(ids):
+       if k <= 0:
+          ids = ids[:0]
+       else:
+          negated = -scores[ids]
+          kth = np.partition(negated, k - 1)[k - 1] # score of the k-th best document
+          better = ids[negated < kth]
+          ids = np.concatenate((better, ids[negated == kth][:k - len(better)])) # ties by increasing id
+    ids = ids[np.argsort(-scores[ids], kind='mergesort')]
+    return ids, scores[ids]
+
+#################################################################################
+## @brief   top_k_rows
+#  @details This method applies top_k to every row of a block of scores at once.
+#  @param   scores Matrix with the similarity of each query (row) with every document.
+#  @param   k The number of documents returned, or None to return all of them.
+#  @param   drop_zeros If True, the documents with score 0 are not returned.
+#################################################################################
+def top_k_rows(scores, k=None, drop_zeros=False):
+    scores = np.asarray(scores)
+    num_queries, num_docs = scores.shape
+    if k is None or k >= num_docs:
+       ids = np.argsort(-scores, axis=1, kind='mergesort')
+    elif k <= 0:
+       ids = np.zeros((num_queries, 0), dtype=np.intp)
+    else:
+       negated = -scores
+       kth = np.partition(negated, k - 1, axis=1)[:, k - 1:k] # score of the k-th best document of each row
+       better = negated < kth
+       tied = negated == kth
+       missing = k - better.sum(axis=1)
+       selected = better | (tied & (np.cumsum(tied, axis=1) <= missing[:, np.newaxis])) # ties by increasing id
+       ids = np.nonzero(selected)[1].reshape(num_queries, k)
+       order = np.argsort(np.take_along_axis(negated, ids, axis=1), axis=1, kind='mergesort')
+       ids = np.take_along_axis(ids, order, axis=1)
+    top_scores = np.take_along_axis(scores, ids, axis=1)
+    rankings = []
+    for row_ids, row_scores in zip(ids, top_scores):
+        if drop_zeros:
+           positive = row_scores > 0
+           row_ids, row_scores = row_ids[positive], row_scores[positive]
+        rankings.append((row_ids, row_scores))
+    return rankings
+
+#################################################################################
+## @brief   normalized_matrix
+#  @details This method builds the sparse matrix (CSR) of the weighted vectors, one
+#           L2-normalised vector per row, as the similarity index compares them.
+#  @param   vectors The weighted query (or document) vectors.
+#  @param   num_features The number of columns (features) of the matrix.
+#################################################################################
+def normalized_matrix(vectors, num_features):
+    matrix = matutils.corpus2csc(vectors, num_terms=num_features, num_docs=len(vectors), dtype=np.float32).T.tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return scipy.sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+#################################################################################
+## @brief   merge_rankings
+#  @details This method merges the rankings of the shards of a query into the global
+#           top k documents, with the same tie order (increasing id) as top_k.
+#  @param   rankings The (ids, scores) of the query in each shard, with global ids.
+#  @param   k The number of documents returned, or None to return all of them.
+#  @param   drop_zeros If True, the documents with score 0 are not returned.
+#################################################################################
+def merge_rankings(rankings, k=None, drop_zeros=False):
+    ids = np.concatenate([shard_ids for shard_ids, shard_scores in rankings])
+    scores = np.concatenate([shard_scores for shard_ids, shard_scores in rankings])
+    order = np.argsort(ids, kind='mergesort')
+    positions, top_scores = top_k(scores[order], k, drop_zeros)
+    return ids[order][positions], top_scores
+
+#################################################################################
+## @brief   choose_backend
+#  @details This method chooses the similarity backend of the index. The dense
+#           backend stores a num_docs x num_features float32 matrix, while the 
+#           sparse backend stores only the non-zero weights (CSR matrix). With
+#           'auto', the sparse backend is used for the sparse models when the
+#           density of the corpus is below DENSITY_THRESHOLD. The 'sharded' backend
+#           stores the vectors in memory-mapped shards on disk and it is only
+#           used when it is requested.
+#  @param   backend The backend requested: 'auto', 'dense', 'sparse' or 'sharded'.
+#  @param   mode The id of the ranking model.
+#  @param   bow The documents in bag-of-words format.
+#  @param   num_terms The number of terms of the dictionary.
+#################################################################################
+def choose_backend(backend, mode, bow, num_terms):
+    if backend not in ('auto', 'dense', 'sparse', 'sharded'):
+       raise ValueError("Unknown similarity backend: " + str(backend))
+    if backend == 'sparse' and mode not in SPARSE_MODES:
+       raise ValueError("The sparse backend is only available for the TF, TF-IDF and LogEntropy models")
+    if backend != 'auto':
+       return backend
+    if mode not in SPARSE_MODES or len(bow) == 0 or num_terms == 0:
+       return 'dense'
+    if isinstance(bow, compact_corpus.CompactCorpus):
+       num_nnz = bow.nnz()
+    else:
+       num_nnz = sum(len(vector) for vector in bow)
+    density = float(num_nnz) / (len(bow) * num_terms)
+    if density < DENSITY_THRESHOLD:
+       return 'sparse'
+    return 'dense'
+
+#################################################################################
+## @brief   corpus_checksum
+#  @details This method returns the SHA-1 checksum of the documents of the corpus.
+#  @param   corpus Set of documents to be processed.
+#################################################################################
+def corpus_checksum(corpus):
+    sha = hashlib.sha1()
+    for doc in corpus:
+        if not isinstance(doc, bytes):
+           doc = doc.encode('utf-8')
+        sha.update(doc)
+        sha.update(b'\0') # document separator
+    return sha.hexdigest()
+
+#################################################################################
+## @brief   load_index
+#  @details This method opens the index stored in the given directory. The similarity
+#           matrix and the model arrays are memory-mapped instead of being read.
+#           It returns None if there is no index or if it was built with another
+#           format, corpus, preprocessing settings, ranking model or parameters.
+#  @param   directory The index directory.
+#  @param   checksum The checksum of the corpus.
+#  @param   settings The preprocessing settings.
+#  @param   mode The id of the ranking model.
+#  @param   backend The similarity backend requested ('auto' accepts any backend).
+#  @param   model_params The hyperparameters of the model.
+#  @param   quantize The type of the quantized weights (None for float32).
+#################################################################################
+def load_index(directory, checksum, settings, mode, backend='auto', model_params=None, quantize=None):
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(manifest_path):
+       return None
+    with open(manifest_path) as manifest_file:
+         manifest = json.load(manifest_file)
+    if (manifest.get('version') != INDEX_FORMAT_VERSION or manifest.get('corpus_checksum') != checksum
+        or manifest.get('preprocessing') != settings or manifest.get('mode') != mode
+        or backend not in ('auto', manifest.get('backend')) or manifest.get('model_params') != (model_params or dict())
+        or (manifest.get('backend') == 'dense' and manifest.get('quantize') != quantize)):
+       return None # stale index
+    dictionary = corpora.Dictionary.load(os.path.join(directory, 'dictionary.dict'))
+    bow = corpora.MmCorpus(os.path.join(directory, 'bow.mm'))
+    model = None
+    if mode in MODEL_CLASSES:
+       model = MODEL_CLASSES[mode].load(os.path.join(directory, 'model'), mmap='r')
+    if manifest['backend'] == 'sharded':
+       index = sharded_index.ShardedSimilarity(os.path.join(directory, 'shards'))
+    elif manifest.get('quantize') is not None:
+       index = quantization.QuantizedSimilarity.load(os.path.join(directory, 'similarity.index'), mmap='r')
+    else:
+       index = SIMILARITY_CLASSES[manifest['backend']].load(os.path.join(directory, 'similarity.index'), mmap='r')
+    loaded = IRIndex(dictionary, bow, model, mode, index=index, backend=manifest['backend'], quantize=manifest.get('quantize'))
+    loaded.directory = directory
+    loaded.uid = manifest.get('uid', loaded.uid) # the same index as when it was saved
+    return loaded
+
+###################################################################################
+## @class   IRIndex
+#  @brief   This class represents the index of a corpus for a given ranking model,
+#           i.e., the structures built once and reused to score every query.
+###################################################################################
+class IRIndex(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @details This method weights the documents with the trained model and builds
+    #           the similarity index over them.
+    #  @param   dictionary The dictionary with the documents keywords.
+    #  @param   bow The documents in bag-of-words format.
+    #  @param   model The trained model (None in mode 1).
+    #  @param   mode The id of the ranking model.
+    #  @param   index The similarity index, if it has been loaded from disk.
+    #  @param   backend The similarity backend: 'auto', 'dense', 'sparse' or 'sharded'.
+    #  @param   shard_dir The directory of the shards (sharded backend).
+    #  @param   shard_size The maximum number of documents of each shard.
+    #  @param   quantize The type of the weights of the dense backend: None (float32),
+    #           'float16' or 'int8'. The sparse index chosen by 'auto' is not
+    #           quantized, since it is already smaller.
+    #################################################################################
+    def __init__(self, dictionary, bow, model, mode, index=None, backend='auto', shard_dir=None,
+                 shard_size=sharded_index.DEFAULT_SHARD_SIZE, quantize=None):
+        if quantize is not None and quantize not in quantization.QUANTIZED_TYPES:
+           raise ValueError("Unknown quantized type: %s (available: %s)" % (quantize, ", ".join(quantization.QUANTIZED_TYPES)))
+        if quantize is not None and backend not in ('auto', 'dense'):
+           raise ValueError("The quantized weights are only available for the dense backend")
+        self.dictionary = dictionary
+        self.bow = bow
+        self.model = model
+        self.mode = mode
+        if index is None:
+           backend = choose_backend(backend, mode, bow, len(dictionary))
+        self.quantize = quantize if backend == 'dense' else None
+        if index is None:
+           if backend == 'sharded':
+              index = self.build_shards(shard_dir, shard_size)
+           else:
+              index = self.build_similarity(backend)
+        self.backend = backend
+        self.index = index
+        self.deleted = set() # tombstones of the deleted documents until the index is compacted
+        self.owns_model = False # the model may be shared with the model cache until it is updated
+        self.version = 0 # increased every time the documents of the index change
+        self.uid = uuid.uuid4().hex # identity of the built index, renewed when its rankings change
+        self.directory = None # directory where the index is stored
+        self.ann = None # approximate nearest neighbour index of the topic vectors
+        if backend == 'sharded' or self.quantize is not None:
+           self.num_features = index.num_features
+        else:
+           self.num_features = index.index.shape[1]
+
+    #################################################################################
+    ## @brief   build_similarity
+    #  @details This method weights the documents and builds the similarity index of
+    #           the dense or sparse backend, with quantized weights if requested.
+    #  @param   backend The similarity backend: 'dense' or 'sparse'.
+    #################################################################################
+    def build_similarity(self, backend):
+        index = SIMILARITY_CLASSES[backend](self.weight_documents(self.bow), num_features=self.model_features())
+        if self.quantize is not None:
+           index = quantization.QuantizedSimilarity(index.index, self.quantize)
+        return index
+
+    #################################################################################
+    ## @brief   build_shards
+    #  @details This method writes the weighted documents into shards on disk. The
+    #           corpus is streamed: only the documents of one shard are weighted and
+    #           normalised at a time.
+    #  @param   shard_dir The directory of the shards.
+    #  @param   shard_size The maximum number of documents of each shard.
+    #################################################################################
+    def build_shards(self, shard_dir, shard_size):
+        if shard_dir is None:
+           raise ValueError("The sharded backend needs an index directory")
+        index = sharded_index.ShardedSimilarity(shard_dir, self.model_features(), shard_size, self.mode in SPARSE_MODES)
+        index.clear()
+        docs = iter(self.bow)
+        shard = list(itertools.islice(docs, shard_size))
+        while len(shard) > 0:
+            index.add_documents(normalized_matrix(self.weight_documents(shard), self.model_features()))
+            shard = list(itertools.islice(docs, shard_size))
+        return index
+
+    #################################################################################
+    ## @brief   build_ann
+    #  @details This method builds the approximate nearest neighbour index (IVF) of
+    #           the topic vectors. Once it is built, the queries are only scored
+    #           against the documents of the nprobe closest clusters.
+    #  @param   num_lists The number of clusters (None uses sqrt(num_docs)).
+    #  @param   nprobe The number of clusters scored per query.
+    #  @param   iterations The number of k-means iterations.
+    #  @param   seed The seed of the k-means initialization.
+    #################################################################################
+    def build_ann(self, num_lists=None, nprobe=ann_index.DEFAULT_NPROBE, iterations=ann_index.DEFAULT_ITERATIONS, seed=0):
+        if self.mode not in TOPIC_MODES or self.backend != 'dense' or self.quantize is not None:
+           raise ValueError("The approximate index is only available for the dense (not quantized) LDA, LSI and RP indexes")
+        self.ann = ann_index.IVFIndex(self.index.index, num_lists, nprobe, iterations, seed)
+        self.uid = uuid.uuid4().hex # the approximate rankings differ from the exact ones
+        return self.ann
+
+    #################################################################################
+    ## @brief   ann_recall
+    #  @details This method returns the recall@k of the approximate rankings of the
+    #           queries with respect to the exact rankings of the similarity index.
+    #           The index is not changed, so it can be called while other threads
+    #           rank queries.
+    #  @param   query_weights The weighted query vectors.
+    #  @param   k The number of documents compared.
+    #  @param   nprobe The number of clusters scored (None uses the index default).
+    #################################################################################
+    def ann_recall(self, query_weights, k=10, nprobe=None):
+        if self.ann is None:
+           raise ValueError("The index has no approximate index (build_ann)")
+        approximate = self.rank_batch(query_weights, k, nprobe=nprobe)
+        exact = self.rank_batch(query_weights, k, exact=True)
+        return ann_index.recall_at_k(exact, approximate, k)
+
+    #################################################################################
+    ## @brief   model_features
+    #  @details This method returns the number of features of the weighted vectors:
+    #           the terms of the dictionary or the topics of the topic models.
+    #################################################################################
+    def model_features(self):
+        if self.mode in TOPIC_MODES:
+            return self.model.num_topics
+        return len(self.dictionary)
+
+    #################################################################################
+    ## @brief   weight_documents
+    #  @details This method returns the documents vectors stored in the similarity index.
+    #           The documents of the topic models are transformed once into topic
+    #           space, as the queries, so the index is a num_docs x num_topics matrix.
+    #  @param   bow The documents in bag-of-words format.
+    #################################################################################
+    def weight_documents(self, bow):
+        if self.mode == 1:
+            return [tf_weights(v) for v in bow]  # TF weighted documents
+        elif self.mode in (2, 7):
+            return [self.model[v] for v in bow]  # TF-IDF / LogEntropy weighted documents
+        return list(self.model[[self.model_terms(v) for v in bow]])  # LDA / LSI / RP topic vectors
+
+    #################################################################################
+    ## @brief   weight_query
+    #  @details This method weights the query vector in the same way as the documents.
+    #  @param   vq The query in bag-of-words format.
+    #################################################################################
+    def weight_query(self, vq):
+        if self.mode == 1:
+            return tf_weights(vq)
+        elif self.mode in TOPIC_MODES:
+            vq = self.model_terms(vq)
+        return self.model[vq]
+
+    #################################################################################
+    ## @brief   model_terms
+    #  @details This method removes from the vector the terms added to the dictionary
+    #           after the topic model was trained, which the model does not know.
+    #  @param   vector List of (token_id, token_count) 2-tuples
+    #################################################################################
+    def model_terms(self, vector):
+        return [(term_id, count) for term_id, count in vector if term_id < self.model.num_terms]
+
+    #################################################################################
+    ## @brief   score
+    #  @details This method returns the similarity of the query with every document.
+    #  @param   query_weight The weighted query vector.
+    #################################################################################
+    def score(self, query_weight):
+        if self.backend == 'sharded':
+           queries = normalized_matrix([query_weight], self.num_features)
+           return np.concatenate([block[0] for offset, block in self.index.score_blocks(queries)])
+        return self.index[query_weight]
+
+    #################################################################################
+    ## @brief   score_block
+    #  @details This method scores a set of queries with one matrix product and returns
+    #           the block of scores (queries x documents).
+    #  @param   queries The CSR matrix with the L2-normalised query vectors.
+    #################################################################################
+    def score_block(self, queries):
+        if self.backend == 'sparse':
+           return self.index.index.dot(queries.T).T.toarray() # sparse product with the CSR index
+        if self.quantize is not None:
+           return self.index.score_block(queries.toarray()) # dequantized block by block
+        return np.dot(self.index.index, queries.toarray().T).T # BLAS product with the dense index
+
+    #################################################################################
+    ## @brief   rank
+    #  @details This method returns the ids and scores of the top k documents for the 
+    #           query.
+    #  @param   query_weight The weighted query vector.
+    #  @param   k The number of documents returned, or None to return all of them.
+    #  @param   drop_zeros If True, the documents with score 0 are not returned.
+    #################################################################################
+    def rank(self, query_weight, k=None, drop_zeros=False):
+        if self.backend == 'sharded' or self.ann is not None or len(self.deleted) > 0:
+           return self.rank_batch([query_weight], k, drop_zeros)[0]
+        return top_k(self.score(query_weight), k, drop_zeros)
+
+    #################################################################################
+    ## @brief   rank_batch
+    #  @details This method ranks a set of queries with one matrix product per chunk
+    #           of queries. With the sharded backend every shard is scored and ranked
+    #           on its own and the rankings of the shards are merged. With the
+    #           approximate index every query is scored against its candidates. The
+    #           deleted documents are removed from the rankings.
+    #  @param   query_weights The weighted query vectors.
+    #  @param   k The number of documents returned, or None to return all of them.
+    #  @param   drop_zeros If True, the documents with score 0 are not returned.
+    #  @param   chunksize The number of queries scored with each product.
+    #  @param   exact If True, the approximate index is not used.
+    #  @param   nprobe The number of clusters scored by the approximate index (None
+    #           uses the index default).
+    #################################################################################
+    def rank_batch(self, query_weights, k=None, drop_zeros=False, chunksize=256, exact=False, nprobe=None):
+        if len(self.deleted) > 0:
+           deleted = np.array(sorted(self.deleted))
+           rankings = []
+           for ids, scores in self.rank_batch_documents(query_weights, None if k is None else k + len(deleted), drop_zeros, chunksize,
+                                                        exact, nprobe):
+               alive = ~np.isin(ids, deleted)
+               rankings.append((ids[alive][:k], scores[alive][:k]))
+           return rankings
+        return self.rank_batch_documents(query_weights, k, drop_zeros, chunksize, exact, nprobe)
+
+    def rank_batch_documents(self, query_weights, k, drop_zeros, chunksize, exact=False, nprobe=None):
+        queries = normalized_matrix(query_weights, self.num_features)
+        rankings = []
+        for start in range(0, queries.shape[0], chunksize):
+            chunk = queries[start:start + chunksize]
+            if self.ann is not None and not exact:
+               for query in chunk.toarray():
+                   ids, scores = self.ann.candidates(query, nprobe)
+                   positions, top_scores = top_k(scores, k, drop_zeros)
+                   rankings.append((ids[positions], top_scores))
+            elif self.backend == 'sharded':
+               shard_rankings = [[] for row in range(chunk.shape[0])]
+               for offset, block in self.index.score_blocks(chunk):
+                   for row, (ids, scores) in enumerate(top_k_rows(block, k, drop_zeros)):
+                       shard_rankings[row].append((ids + offset, scores))
+               rankings.extend(merge_rankings(row_rankings, k, drop_zeros) for row_rankings in shard_rankings)
+            else:
+               rankings.extend(top_k_rows(self.score_block(chunk), k, drop_zeros))
+        return rankings
+
+    #################################################################################
+    ## @brief   add_documents
+    #  @details This method adds documents to the index without rebuilding it: the
+    #           dictionary is extended, the bag-of-words rows are appended, the model
+    #           is updated (document frequencies of TF-IDF and global weights of 
+    #           LogEntropy, online training of LSI and LDA) and the new vectors are
+    #           appended to the similarity index. The vectors of the previous 
+    #           documents keep their weights until the index is compacted.
+    #           It returns the ids of the new documents.
+    #  @param   pdocs The taxonomy of keywords of each new document.
+    #################################################################################
+    def add_documents(self, pdocs):
+        if not isinstance(self.bow, compact_corpus.CompactCorpus):
+           self.bow = compact_corpus.CompactCorpus(self.bow) # the documents loaded from disk are streamed
+        first_id = len(self.bow)
+        new_bow = [self.dictionary.doc2bow(doc, allow_update=True) for doc in pdocs]
+        self.bow.extend(new_bow)
+        self.own_model()
+        if self.mode == 2:
+           for vector in new_bow:
+               for term_id, count in vector:
+                   self.model.dfs[term_id] = self.model.dfs.get(term_id, 0) + 1
+           self.model.num_docs += len(new_bow)
+           self.model.num_nnz += sum(len(vector) for vector in new_bow)
+           self.model.idfs = precompute_idfs(self.model.wglobal, self.model.dfs, self.model.num_docs)
+        elif self.mode == 7:
+           self.update_log_entropy()
+        elif self.mode in (3, 4):
+           self.model.update([self.model_terms(vector) for vector in new_bow])
+        elif self.mode == 5:
+           self.model.add_documents([self.model_terms(vector) for vector in new_bow])
+        self.append_vectors(self.weight_documents(new_bow))
+        self.modified()
+        return list(range(first_id, len(self.bow)))
+
+    #################################################################################
+    ## @brief   own_model
+    #  @details This method copies the model before it is updated, since it may be
+    #           shared with the model cache or memory-mapped read-only from disk.
+    #################################################################################
+    def own_model(self):
+        if not self.owns_model:
+           self.model = copy.deepcopy(self.model)
+           self.owns_model = True
+
+    #################################################################################
+    ## @brief   update_log_entropy
+    #  @details This method recomputes the global weights of the LogEntropy model from
+    #           the stored bag-of-words (the documents are not preprocessed again).
+    #################################################################################
+    def update_log_entropy(self):
+        self.model.entr = dict()
+        self.model.initialize([vector for doc, vector in enumerate(self.bow) if doc not in self.deleted])
+
+    #################################################################################
+    ## @brief   append_vectors
+    #  @details This method appends the weighted vectors to the similarity index. 
+    #  @param   weighted_docs The weighted vectors of the new documents.
+    #################################################################################
+    def append_vectors(self, weighted_docs):
+        num_features = self.model_features()
+        rows = normalized_matrix(weighted_docs, num_features)
+        if self.backend == 'sharded':
+           self.index.add_documents(rows) # appended as new shards
+        elif self.backend == 'sparse':
+           old = self.index.index
+           old = scipy.sparse.csr_matrix((old.data, old.indices, old.indptr), shape=(old.shape[0], num_features))
+           self.index.index = scipy.sparse.vstack([old, rows]).tocsr()
+        elif self.quantize is not None:
+           self.index.append(rows.toarray(), num_features)
+        else:
+           old = self.index.index
+           matrix = np.zeros((old.shape[0] + rows.shape[0], num_features), dtype=old.dtype)
+           matrix[:old.shape[0], :old.shape[1]] = old
+           matrix[old.shape[0]:] = rows.toarray()
+           self.index.index = matrix
+           self.index.num_features = num_features
+           if self.ann is not None:
+              self.ann.add(matrix) # assigned to the existing clusters
+        self.num_features = num_features
+
+    #################################################################################
+    ## @brief   delete_documents
+    #  @details This method marks the documents as deleted (tombstones). They are not
+    #           ranked any more and they are removed when the index is compacted.
+    #  @param   doc_ids The ids of the documents to be deleted.
+    #################################################################################
+    def delete_documents(self, doc_ids):
+        self.deleted.update(int(doc) for doc in doc_ids)
+        self.modified()
+
+    #################################################################################
+    ## @brief   compact
+    #  @details This method removes the deleted documents, recomputes the statistics 
+    #           of the dictionary and of the TF-IDF/LogEntropy models and rebuilds the
+    #           similarity index with the current weights. The remaining documents 
+    #           are renumbered; it returns the old id of each new id.
+    #################################################################################
+    def compact(self):
+        kept = np.array([doc for doc in range(len(self.bow)) if doc not in self.deleted], dtype=np.intp)
+        self.own_model()
+        if not isinstance(self.bow, compact_corpus.CompactCorpus):
+           self.bow = compact_corpus.CompactCorpus(self.bow)
+        self.bow = self.bow.select(kept)
+        self.deleted = set()
+        dfs = np.bincount(self.bow.indices, minlength=len(self.dictionary))
+        cfs = np.bincount(self.bow.indices, weights=self.bow.data, minlength=len(self.dictionary))
+        present = np.flatnonzero(dfs).tolist()
+        self.dictionary.dfs = dict(zip(present, dfs[present].tolist()))
+        self.dictionary.cfs = dict(zip(present, cfs[present].astype(np.int64).tolist()))
+        self.dictionary.num_docs, self.dictionary.num_pos, self.dictionary.num_nnz = len(self.bow), int(self.bow.data.sum()), self.bow.nnz()
+        if self.mode == 2:
+           self.model.dfs = dict(self.dictionary.dfs)
+           self.model.num_docs = len(self.bow)
+           self.model.num_nnz = self.dictionary.num_nnz
+           self.model.idfs = precompute_idfs(self.model.wglobal, self.model.dfs, self.model.num_docs)
+        elif self.mode == 7:
+           self.update_log_entropy()
+        if self.backend == 'sharded':
+           self.index = self.build_shards(self.index.directory, self.index.shard_size)
+        else:
+           self.index = self.build_similarity(self.backend)
+        self.num_features = self.model_features()
+        if self.ann is not None:
+           self.build_ann(**self.ann.params)
+        self.modified()
+        return kept
+
+    #################################################################################
+    ## @brief   modified
+    #  @details This method increases the version of the index and renews its identity
+    #           after its documents change. The shards of the sharded backend are modified on disk, so 
+    #           the manifest of the stored index is removed until it is saved again.
+    #################################################################################
+    def modified(self):
+        self.version += 1
+        self.uid = uuid.uuid4().hex
+        if self.backend == 'sharded' and self.directory is not None:
+           manifest_path = os.path.join(self.directory, 'manifest.json')
+           if os.path.exists(manifest_path):
+              os.remove(manifest_path)
+
+    #################################################################################
+    ## @brief   cache_id
+    #  @details This method returns the identity of the rankings of the index for the
+    #           query cache: the identity of the built (or loaded) index, the version
+    #           of its documents and the clusters scored by the approximate index.
+    #################################################################################
+    def cache_id(self):
+        return (self.uid, self.version, None if self.ann is None else self.ann.nprobe)
+
+    #################################################################################
+    ## @brief   save
+    #  @details This method stores the index in the given directory: the dictionary,
+    #           the documents, the model, the similarity matrix as a .npy file and a
+    #           manifest written last, so an interrupted save is detected as stale.
+    #  @param   directory The index directory.
+    #  @param   checksum The checksum of the corpus.
+    #  @param   settings The preprocessing settings.
+    #  @param   model_params The hyperparameters of the model.
+    #################################################################################
+    def save(self, directory, checksum, settings, model_params=None):
+        if not os.path.exists(directory):
+           os.makedirs(directory)
+        self.directory = directory
+        manifest_path = os.path.join(directory, 'manifest.json')
+        if os.path.exists(manifest_path):
+           os.remove(manifest_path)
+        self.dictionary.save(os.path.join(directory, 'dictionary.dict'))
+        corpora.MmCorpus.serialize(os.path.join(directory, 'bow.mm'), self.bow)
+        if self.mode in MODEL_CLASSES:
+           self.model.save(os.path.join(directory, 'model'))
+        if self.quantize is not None:
+           self.index.save(os.path.join(directory, 'similarity.index'), separately=['values', 'scales'])
+        elif self.backend != 'sharded': # the shards are already stored in the directory
+           self.index.save(os.path.join(directory, 'similarity.index'), separately=['index'])
+        manifest = {'version': INDEX_FORMAT_VERSION,
+                    'corpus_checksum': checksum,
+                    'preprocessing': settings,
+                    'mode': self.mode,
+                    'backend': self.backend,
+                    'model': MODEL_NAMES[self.mode],
+                    'model_params': model_params or dict(),
+                    'quantize': self.quantize,
+                    'uid': self.uid,
+                    'num_docs': len(self.bow),
+                    'num_terms': len(self.dictionary)}
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+             json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.rename(manifest_path + '.tmp', manifest_path)
@@ -4,14 +4,20 @@
 #             implemented using Python, NLTK and GenSIM.
 #  @authors   Yolanda de la Hoz Simon
 ###################################################################################
-from nltk.tokenize import wordpunct_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
-from gensim import corpora, models, similarities
-from operator import itemgetter
+from gensim import corpora
 import abc
-import re
 import numpy as np
+import os
+import time
+import bm25
+import boolean_query
+import compact_corpus
+import corpus_reader
+import inverted_index
+import ir_index
+import model_cache
+import parallel_indexing
+import text_analyzer
 ###################################################################################
 ## @class   InformationRetrievalSystem
 #  @brief   This class represents the InformationRetrievalSystem, i.e., basic methods 
@@ -23,11 +29,53 @@ class IRSystem(object):
     ## @brief   Constructor
     #  @details This method initializes the class with the parameters introduced by 
     #           the user and execute the query. 
+    #  @param   index_dir Directory where the index is stored and reloaded from.
+    #  @param   processes Number of processes used to preprocess the corpus.
+    #  @param   top_k Number of documents ranked for each query (None ranks all of them).
+    #  @param   drop_zeros If True, the documents with score 0 are not ranked.
+    #  @param   batch If True, a list of queries is scored with one matrix product.
+    #  @param   backend Similarity backend: 'auto' (by corpus density), 'dense', 'sparse'
+    #           or 'sharded' (needs index_dir).
+    #  @param   model_params Hyperparameters of the trained model (e.g. num_topics).
+    #  @param   model_cache_dir Directory where the trained models are cached (by default
+    #           index_dir/models if index_dir is given).
+    #  @param   ann_params Parameters of the approximate index of the LDA, LSI and RP
+    #           models (e.g. num_lists, nprobe), or None to rank them exactly.
+    #  @param   corpus_view The preprocessed corpus (dictionary, pdocs, bow) shared by 
+    #           several models (create_corpus_view), a LazyCorpusView that only 
+    #           preprocesses it if an index has to be built, or None to preprocess it.
+    #  @param   query_cache The cache of the rankings of the queries (QueryCache) shared
+    #           by the models of the corpus, or None to rank every query.
+    #  @param   compress_postings If True, the posting lists of the Boolean and BM25 
+    #           models are compressed (smaller, slower to read).
+    #  @param   quantize The type of the weights of the dense similarity index: None
+    #           (float32), 'float16' or 'int8'.
+    #  @param   verbose If False, the queries and the ranked documents are not printed.
     #################################################################################    
-    def __init__(self, corpus, queries):
+    def __init__(self, corpus, queries, index_dir=None, processes=1, top_k=None, drop_zeros=False, batch=False, backend='auto',
+                 model_params=None, model_cache_dir=None, ann_params=None, corpus_view=None, query_cache=None,
+                 compress_postings=False, quantize=None, verbose=True):
         __metaclass__ = abc.ABCMeta
         self.corpus=corpus
         self.queries=queries
+        self.index_dir=index_dir
+        self.processes=processes
+        self.top_k=top_k
+        self.drop_zeros=drop_zeros
+        self.batch=batch
+        self.backend=backend
+        self.model_params=model_params or dict()
+        if model_cache_dir is None and index_dir is not None:
+           model_cache_dir = os.path.join(index_dir, 'models')
+        self.model_cache_dir=model_cache_dir
+        self.ann_params=ann_params
+        self.corpus_view=corpus_view
+        self.query_cache=query_cache
+        self.compress_postings=compress_postings
+        self.quantize=quantize
+        self.verbose=verbose
+        self.analyzer=text_analyzer.default_analyzer()
+        self.model_cache=model_cache.default_model_cache()
 
 
     #################################################################################
@@ -36,23 +84,20 @@ class IRSystem(object):
     #  @param   doc The document to be preprocessed
     #################################################################################    
     def preprocess_document(self,doc):
-        stopset = set(stopwords.words('english'))
-        stemmer = PorterStemmer()
-        tokens = wordpunct_tokenize(doc) # split text on whitespace and punctuation
-        clean = [token.lower() for token in tokens if token.lower() not in stopset and len(token) > 2]
-        final = [stemmer.stem(word) for word in clean]
-        return final
+        return self.analyzer.analyze(doc)
 
 
     #################################################################################
     ## @brief   create_dictionary
     #  @details This method creates a dictionary based on the taxonomy of keywords for each document.
+    #           The documents are sharded across a pool of processes if processes > 1.
     #  @param   docs The documents to be preprocessed
     #################################################################################    
     def create_dictionary(self,docs):
-        pdocs = [self.preprocess_document(doc) for doc in docs]
+        if self.processes > 1:
+           return parallel_indexing.create_dictionary(self.analyzer, docs, self.processes)
+        pdocs = self.analyzer.analyze_many(docs)
         dictionary = corpora.Dictionary(pdocs)
-        dictionary.save('vsm.dict')
         return dictionary,pdocs
 
     #################################################################################
@@ -66,37 +111,160 @@ class IRSystem(object):
     #################################################################################
     ## @brief   docs2bows
     #  @details This method converts document (a list of words) into the bag-of-words
-    #  format = list of (token_id, token_count) 2-tuples.
+    #  format = list of (token_id, token_count) 2-tuples, stored in the flat arrays
+    #  of a CompactCorpus.
+    #  The documents are sharded across a pool of processes if processes > 1.
     #  @param   corpus Set of documents to be processed.
     #  @param   dictionary The dictionary with the documents keywords.
     #################################################################################    
     def docs2bows(self,corpus, dictionary, pdocs):
-        vectors = [dictionary.doc2bow(doc) for doc in pdocs]
-        corpora.MmCorpus.serialize('vsm_docs.mm', vectors) # Save the corpus in the Matrix Market format
-        return vectors
+        if self.processes > 1:
+           return compact_corpus.CompactCorpus(parallel_indexing.docs2bows(dictionary, pdocs, self.processes))
+        return compact_corpus.CompactCorpus(dictionary.doc2bow(doc) for doc in pdocs)
+
+    def preprocess_corpus(self,corpus):
+        dictionary,pdocs,bow = self.create_corpus_view(corpus)
+        return dictionary, pdocs
+
+    #################################################################################
+    ## @brief   create_corpus_view
+    #  @details This method returns the dictionary, the taxonomy of keywords and the
+    #           bag-of-words of the documents. The corpus is streamed one document at
+    #           a time and the taxonomy of keywords is not kept (None), unless a list
+    #           of documents is sharded across a pool of processes. The view given in
+    #           the constructor is reused, so the corpus is preprocessed once for 
+    #           several models; the models share it, so documents must not be added
+    #           to their indexes.
+    #  @param   corpus Set of documents to be processed (a list, or an iterable such
+    #           as corpus_reader.CorpusTexts).
+    #################################################################################
+    def create_corpus_view(self,corpus):
+        if isinstance(self.corpus_view, LazyCorpusView):
+           return self.corpus_view.get()
+        if self.corpus_view is not None:
+           return self.corpus_view
+        if self.processes > 1 and isinstance(corpus, list):
+           dictionary,pdocs = self.create_dictionary(corpus)
+           return dictionary, pdocs, self.docs2bows(corpus, dictionary, pdocs)
+        dictionary,bow = corpus_reader.build_bow(self.analyzer, corpus)
+        return dictionary, None, bow
+
+    #################################################################################
+    ## @brief   build_inverted_index
+    #  @details This method builds the posting lists of the corpus (Boolean and BM25
+    #           models), compressed if compress_postings was given.
+    #  @param   corpus Set of documents to be processed.
+    #################################################################################
+    def build_inverted_index(self,corpus):
+        dictionary,pdocs,bow = self.create_corpus_view(corpus)
+        return inverted_index.InvertedIndex(dictionary, bow, self.compress_postings)
+
+    #################################################################################
+    ## @brief   print_ranking
+    #  @details This method prints the query and its ranked documents (verbose mode).
+    #  @param   corpus Set of documents to be processed.
+    #  @param   q Query written in Natural Language.
+    #  @param   ids The ids of the ranked documents.
+    #  @param   scores The scores of the ranked documents.
+    #################################################################################
+    def print_ranking(self,corpus, q, ids, scores):
+        if self.verbose:
+           print("\n-------------------------->Query = " + q ) 
+           for doc, score in zip(ids, scores):
+               print ("[ Score = " + "%.3f" % round(score, 3) + "] " + self.document_text(corpus, doc));
+
+    #################################################################################
+    ## @brief   document_text
+    #  @details This method returns the text of the document to be printed, or its
+    #           position if the corpus is streamed (corpus_reader.CorpusTexts), since
+    #           the texts are not kept in memory.
+    #  @param   corpus Set of documents to be processed.
+    #  @param   doc The position of the document in the corpus.
+    #################################################################################
+    def document_text(self,corpus, doc):
+        if hasattr(corpus, '__getitem__'):
+           return corpus[doc]
+        return "(document %d)" % doc
+
+    #################################################################################
+    ## @brief   rank_query
+    #  @details This method scores the query against the index built for the corpus
+    #           and returns the ids and scores of the top k documents as arrays. If
+    #           the ranking of the same keywords is in the query cache, it is returned
+    #           without scoring the query. The state of the system is not changed, so
+    #           several threads can rank queries at the same time.
+    #  @param   q Query, a document with the set of relevance words to the user.
+    #  @param   index The index built once for the corpus and the ranking model.
+    #  @param   top_k Number of documents ranked (None ranks all of them).
+    #  @param   drop_zeros If True, the documents with score 0 are not ranked.
+    #################################################################################   
+    def rank_query(self,q, index, top_k=None, drop_zeros=False):
+        vq=self.create_query_view(q,index.dictionary)
+        if self.query_cache is None:
+           return index.rank(index.weight_query(vq), top_k, drop_zeros)
+        key = self.query_cache.key(vq, index.mode, top_k, drop_zeros, index.cache_id())
+        ranking = self.query_cache.get(key)
+        if ranking is None:
+           ranking = self.query_cache.put(key, index.rank(index.weight_query(vq), top_k, drop_zeros))
+        return ranking
+
+    #################################################################################
+    ## @brief   search
+    #  @details This method returns the ids and scores of the top k documents for the
+    #           query, ranked with the index of the model. It does not store the 
+    #           ranking, so it can be called by several threads at the same time.
+    #  @param   q Query written in Natural Language.
+    #  @param   top_k Number of documents ranked (None ranks all of them).
+    #  @param   drop_zeros If True, the documents with score 0 are not ranked.
+    #################################################################################   
+    def search(self,q, top_k=None, drop_zeros=False):
+        return self.rank_query(q, self.index, top_k, drop_zeros)
 
     #################################################################################
     ## @brief   ranking_function
-    #  @details This method initializes the class with the parameters introduced by the user
-    #           and execute the query. 
+    #  @details This method scores the query against the index built for the corpus,
+    #           stores the ranking of the top k documents and returns their ids and 
+    #           scores as arrays. 
     #  @param   corpus Set of documents to be processed.
     #  @param   q Query, a document with the set of relevance words to the user.
+    #  @param   query_id The id of the query.
+    #  @param   index The index built once for the corpus and the ranking model.
+    #  @param   top_k Number of documents ranked (None ranks all of them).
+    #  @param   drop_zeros If True, the documents with score 0 are not ranked.
     #################################################################################   
-    def ranking_function(self,corpus, q, query_id, mode):
-        model, dictionary = self.create_documents_view(corpus, mode)
-        loaded_corpus = corpora.MmCorpus('vsm_docs.mm')
-        index = similarities.MatrixSimilarity(loaded_corpus, num_features=len(dictionary))
-        vq=self.create_query_view(q,dictionary)
-        if (mode == 1):
-           self.query_weight  = [(w[0], 1 + np.log2(w[1])) for w in vq]
-        else:
-            self.query_weight = model[vq]
-        sim = index[self.query_weight]
-        ranking = sorted(enumerate(sim), key=itemgetter(1), reverse=True)
-        self.ranking_query[query_id]=ranking # store the ranking of the query in a dict
-        for doc, score in ranking:
-            print ("[ Score = " + "%.3f" % round(score, 3) + "] " + corpus[doc]);
+    def ranking_function(self,corpus, q, query_id, index, top_k=None, drop_zeros=False):
+        ids, scores = self.rank_query(q, index, top_k, drop_zeros)
+        self.ranking_query[query_id]=list(zip(ids.tolist(), scores.tolist())) # store the ranking of the query in a dict
+        self.print_ranking(corpus, q, ids, scores)
+        return ids, scores
       
+    #################################################################################
+    ## @brief   batch_ranking_function
+    #  @details This method scores all the queries at once: the queries are weighted
+    #           into a sparse matrix, multiplied with the index and the top k documents
+    #           of every row are selected together. The queries found in the query 
+    #           cache are not scored.
+    #  @param   corpus Set of documents to be processed.
+    #  @param   queries List of queries written in Natural Language.
+    #  @param   index The index built once for the corpus and the ranking model.
+    #  @param   top_k Number of documents ranked (None ranks all of them).
+    #  @param   drop_zeros If True, the documents with score 0 are not ranked.
+    #################################################################################   
+    def batch_ranking_function(self,corpus, queries, index, top_k=None, drop_zeros=False):
+        vqs = [self.create_query_view(q,index.dictionary) for q in queries]
+        if self.query_cache is None:
+           rankings = index.rank_batch([index.weight_query(vq) for vq in vqs], top_k, drop_zeros)
+        else:
+           keys = [self.query_cache.key(vq, index.mode, top_k, drop_zeros, index.cache_id()) for vq in vqs]
+           rankings = [self.query_cache.get(key) for key in keys]
+           misses = [position for position, ranking in enumerate(rankings) if ranking is None]
+           scored = index.rank_batch([index.weight_query(vqs[position]) for position in misses], top_k, drop_zeros) if len(misses) > 0 else []
+           for position, ranking in zip(misses, scored):
+               rankings[position] = self.query_cache.put(keys[position], ranking)
+        for query_id, (ids, scores) in enumerate(rankings):
+            self.ranking_query[query_id]=list(zip(ids.tolist(), scores.tolist()))
+        return rankings
+
     #################################################################################
     ## @brief   create_query_view
     #  @details This method preprocess the query written in NL to build the query view
@@ -113,177 +281,310 @@ class IRSystem(object):
     #  @param   corpus Set of documents to be processed.
     #################################################################################  
     def create_documents_view(self,corpus, ir_mode):
-        dictionary,pdocs = self.create_dictionary(corpus)
-        bow = self.docs2bows(corpus, dictionary,pdocs)     
-        loaded_corpus = corpora.MmCorpus('vsm_docs.mm') # Recover the corpus
+        dictionary,pdocs,bow = self.create_corpus_view(corpus)
 
         if ir_mode == 1:
-             model = [[(w[0], 1 + np.log2(w[1])) for w in v] for v in bow] # TF model
-        elif ir_mode == 2:
-             model = models.TfidfModel(loaded_corpus) # TF IDF model
-        elif ir_mode == 3:
-             model = models.LdaModel(loaded_corpus) # LDA model
-        elif ir_mode == 4:
-             model = models.LdaMulticore(loaded_corpus) # LDA Multicore model
-        elif ir_mode == 5:
-             model = models.LsiModel(loaded_corpus) # LSI model
-        elif ir_mode == 6:
-             model = models.RpModel(loaded_corpus) # RP model
-        elif ir_mode == 7:
-             model = models.LogEntropyModel(loaded_corpus) # LogEntropyModel model
-
-        # tf = corpora.MmCorpus('vsm_docs.mm') # Recover the corpus
-        
-        return model, dictionary
+             model = None # TF model, the weights are computed from the bag-of-words
+        else: # TF IDF, LDA, LDA Multicore, LSI, RP or LogEntropyModel model, trained once per corpus and parameters
+             model = self.model_cache.get_or_train(ir_index.MODEL_CLASSES[ir_mode], bow, dictionary,
+                                                   self.model_params, self.model_cache_dir)
+
+        return model, dictionary, bow
+
+    #################################################################################
+    ## @brief   build_index
+    #  @details This method builds the index of the corpus for the ranking model, i.e.,
+    #           the dictionary, the weighted documents, the trained model and the
+    #           similarity index. It is built once and reused to score every query.
+    #           If an index directory is given, the index is loaded from it and only 
+    #           rebuilt (and saved) when it is missing or stale. The approximate index
+    #           of the topic models is built when ann_params is given.
+    #  @param   corpus Set of documents to be processed.
+    #  @param   ir_mode The id of the ranking model.
+    #  @param   index_dir Directory where the index is stored and reloaded from.
+    #  @param   backend Similarity backend: 'auto' (by corpus density), 'dense', 'sparse'
+    #           or 'sharded' (needs index_dir).
+    #################################################################################  
+    def build_index(self,corpus, ir_mode, index_dir=None, backend='auto'):
+        shard_dir = None
+        index = None
+        if index_dir is not None:
+           model_dir = os.path.join(index_dir, ir_index.MODEL_NAMES[ir_mode])
+           shard_dir = os.path.join(model_dir, 'shards')
+           checksum = ir_index.corpus_checksum(corpus)
+           index = ir_index.load_index(model_dir, checksum, self.analyzer.settings(), ir_mode, backend, self.model_params, self.quantize)
+        if index is None:
+           model, dictionary, bow = self.create_documents_view(corpus, ir_mode)
+           index = ir_index.IRIndex(dictionary, bow, model, ir_mode, backend=backend, shard_dir=shard_dir, quantize=self.quantize)
+           if index_dir is not None:
+              index.save(model_dir, checksum, self.analyzer.settings(), self.model_params)
+        if self.ann_params is not None and ir_mode in ir_index.TOPIC_MODES:
+           index.build_ann(**self.ann_params)
+        return index
+
+    #################################################################################
+    ## @brief   add_documents
+    #  @details This method preprocesses new documents and adds them to the index 
+    #           without rebuilding it. The new documents get the ids that follow the
+    #           documents of the index; it returns them.
+    #  @param   index The index built for the corpus and the ranking model.
+    #  @param   docs The new documents.
+    #################################################################################  
+    def add_documents(self,index, docs):
+        return index.add_documents(self.analyzer.analyze_many(docs))
 
     #################################################################################
     ## @brief   launch_query
-    #  @details This method initializes the class with the parameters introduced by the user
-    #           and execute the query. 
+    #  @details This method builds the index of the corpus once (unless an index is
+    #           provided) and scores every query against it. 
     #  @param   corpus Set of documents to be processed.
-    #  @param   q Query, a document with the set of relevance words to the user.
+    #  @param   queries Query or list of queries written in Natural Language.
+    #  @param   mode The id of the ranking model.
+    #  @param   index The index to be reused, if it has been already built.
+    #           The rankings are limited to the top_k documents given to the constructor.
     #################################################################################   
-    def query_launcher(self,corpus, queries, mode):
+    def query_launcher(self,corpus, queries, mode, index=None):
+        if index is None:
+           index = self.build_index(corpus, mode, self.index_dir, self.backend)
+        self.index = index
         query_id=0
-        if isinstance(queries, list): # launch queries
+        if isinstance(queries, list) and self.batch: # launch all the queries at once
+           rankings = self.batch_ranking_function(corpus,queries,index,self.top_k,self.drop_zeros)
+           for q, (ids, scores) in zip(queries, rankings):
+               self.print_ranking(corpus, q, ids, scores)
+        elif isinstance(queries, list): # launch queries
            for q in queries:
-               print("\n-------------------------->Query = " + q ) 
-               self.ranking_function(corpus,q,query_id,mode)
+               self.ranking_function(corpus,q,query_id,index,self.top_k,self.drop_zeros)
                query_id += 1;
              
         else:
-            print("\n-------------------------->Query = " + queries ) 
-            self.ranking_function(corpus,queries,1,mode)
+            self.ranking_function(corpus,queries,1,index,self.top_k,self.drop_zeros)
         return
 
+###################################################################################
+## @class   LazyCorpusView
+#  @brief   This class represents the corpus view shared by several models, which is
+#           only preprocessed the first time a model needs it, i.e., when its index
+#           cannot be loaded from the index directory.
+###################################################################################
+class LazyCorpusView(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   corpus Set of documents to be processed.
+    #  @param   options The options of the information retrieval systems (e.g. 
+    #           processes).
+    #################################################################################
+    def __init__(self, corpus, **options):
+        options.pop('corpus_view', None)
+        self.system = IRSystem(corpus, [], **options)
+        self.corpus = corpus
+        self.view = None
+        self.seconds = 0.0 # time spent preprocessing the corpus
+
+    #################################################################################
+    ## @brief   get
+    #  @details This method returns the dictionary, the taxonomy of keywords and the
+    #           bag-of-words of the documents, preprocessing them the first time.
+    #################################################################################
+    def get(self):
+        if self.view is None:
+           start = time.time()
+           self.view = self.system.create_corpus_view(self.corpus)
+           self.seconds = time.time() - start
+        return self.view
+
 
 
 class IRBoolean(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing Boolean information retrieval model--------------------------\n")
         self.ranking_query=dict()
+        if index is None:
+           index=self.build_inverted_index(corpus) # built once for all the queries
+        self.inverted_index=index
+        self.parser=boolean_query.BooleanQueryParser(self.analyzer)
 
         query_id=0
         if isinstance(queries, list): # launch queries
            for q in queries:
-               print("\n-------------------------->Query = " + q ) 
-               or_set,and_set = self.preprocess_query(q)
-               dict_matches = self.process_operators(corpus,or_set,and_set,query_id)
-               self.print_result(dict_matches)
+               query_tree = self.preprocess_query(q)
+               matches = self.process_operators(corpus,query_tree,query_id)
+               self.print_result(corpus,q,matches)
                query_id += 1
         else:
-             print("\n-------------------------->Query = " + queries ) 
-             or_set,and_set = self.preprocess_query(queries)
-             dict_matches = self.process_operators(corpus,or_set,and_set,1)
-             self.print_result(dict_matches)
-
-    def process_operators(self,corpus,or_set,and_set,query_id):   
-        or_list = [val for sublist in or_set for val in sublist]     
-        for or_txt in or_list: # assign score 1 to documents that match with either phrase with or
-            dict_matches = self.document_matches(corpus,or_txt)
-        if len(and_set) > 0: 
-          and_list = [val for sublist in and_set for val in sublist]
-          and_txt= ', '.join(and_list) # treat the and_set as a single query separated by commas
-          dict_matches =  self.document_matches(corpus,and_txt)
-        self.ranking_query[query_id]=dict_matches.items()
-        return dict_matches
+             query_tree = self.preprocess_query(queries)
+             matches = self.process_operators(corpus,query_tree,1)
+             self.print_result(corpus,queries,matches)
 
-    def preprocess_corpus(self,corpus):
-        dictionary,pdocs = self.create_dictionary(corpus)
-        return dictionary, pdocs
+    #################################################################################
+    ## @brief   process_operators
+    #  @details This method evaluates the syntax tree of the query over the inverted 
+    #           index and stores the sorted ids of the matching documents. 
+    #  @param   corpus Set of documents to be processed.
+    #  @param   query_tree The syntax tree of the query.
+    #  @param   query_id The id of the query.
+    #################################################################################  
+    def process_operators(self,corpus,query_tree,query_id):   
+        if query_tree is None: # the query has no keywords
+           matches = inverted_index.EMPTY_POSTINGS
+        else:
+           matches = query_tree.evaluate(self.inverted_index)
+        self.ranking_query[query_id]=[(doc, 1) for doc in matches]
+        return matches
 
+    #################################################################################
+    ## @brief   preprocess_query
+    #  @details This method parses the AND, OR, NOT operators and parentheses of the
+    #           query and returns its syntax tree. 
+    #  @param   q Query written in Natural Language
+    #################################################################################  
     def preprocess_query(self,q):
-        text=re.split(r'[^\w\s]',q) # detection of final of the OR operator, stop punctuation 
-        or_set=[]
-        and_set=[]
-        for phrase in text:
-            txt = re.split("or",phrase)
-            if(len(txt)>1): # there are OR operators
-               or_set.append(txt) 
-            else: 
-               and_set.append(txt) # it is an AND operator
-        return or_set,and_set
-        
-    def document_matches(self,corpus, q):
-        dictionary,pdocs = self.preprocess_corpus(corpus)
-        vq= self.preprocess_document(q) # preprocess query
-        dict_matches=dict((doc,0) for doc in corpus) # Create a dictionary with documents and initial value score 0
-        doc_number = 0 
-        for doc in pdocs:
-            intersection_list = list(set(doc) & set(vq)) 
-            if len(intersection_list)==len(vq): # All terms are contained in the doc
-               dict_matches[corpus[doc_number]]=1       
-            doc_number += 1     
-        return dict_matches
+        return self.parser.parse(q)
+
+    #################################################################################
+    ## @brief   search
+    #  @details This method returns the ids of the first k documents that match the
+    #           query, in increasing order, and their scores (1). It does not store the
+    #           matches, so it can be called by several threads at the same time.
+    #  @param   q Query written in Natural Language.
+    #  @param   top_k Number of documents returned (None returns all the matches).
+    #  @param   drop_zeros Not used, every match has score 1.
+    #################################################################################  
+    def search(self,q, top_k=None, drop_zeros=False):
+        query_tree = boolean_query.BooleanQueryParser(self.analyzer).parse(q) # the parser keeps the position in the query
+        if query_tree is None: # the query has no keywords
+           return np.zeros(0, dtype=np.intp), np.zeros(0)
+        matches = np.asarray(query_tree.evaluate(self.inverted_index), dtype=np.intp)
+        if top_k is not None:
+           matches = matches[:max(top_k, 0)] # no documents for k <= 0, as the other models
+        return matches, np.ones(len(matches))
       
-    def print_result(self,dict_matches):
-        for keys,values in dict_matches.items():
-            print("[ Score = " + str(values) + "] ")
-            print("Document = " + keys)
+    def print_result(self,corpus,q,matches):
+        if self.verbose:
+           print("\n-------------------------->Query = " + q ) 
+           for doc in matches:
+               print("[ Score = 1] ")
+               print("Document = " + self.document_text(corpus, doc))
           
 ################################################ Model in Gensim library ################################################
 
 class IR_tf(IRSystem):
 
- def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+ def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing TF information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,1)
+        self.query_launcher(corpus,queries,1,index)
 
 
 class IR_tf_idf(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing TF IDF information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,2)
+        self.query_launcher(corpus,queries,2,index)
        
         
 class IR_Lda(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing LDA information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,3)
+        self.query_launcher(corpus,queries,3,index)
 
         
 class IR_Lda_Multicore(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing LDA Multicore information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,4)
+        self.query_launcher(corpus,queries,4,index)
 
 class IR_Lsi(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing LSI information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,5)
+        self.query_launcher(corpus,queries,5,index)
 
 
 class IR_Rp(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing Rp information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,6)
+        self.query_launcher(corpus,queries,6,index)
 
 class IR_LogEntropyModel(IRSystem):
 
-    def __init__(self,corpus,queries):
-        IRSystem.__init__(self,corpus,queries)
+    def __init__(self,corpus,queries,index=None,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
         print("\n--------------------------Executing LogEntropyModel information retrieval model--------------------------\n")
         self.ranking_query=dict()
-        self.query_launcher(corpus,queries,7)    
+        self.query_launcher(corpus,queries,7,index)    
+
+################################################ Probabilistic model ################################################
+
+class IR_BM25(IRSystem):
+
+    def __init__(self,corpus,queries,index=None,k1=1.2,b=0.75,**options):
+        IRSystem.__init__(self,corpus,queries,**options)
+        print("\n--------------------------Executing BM25 information retrieval model--------------------------\n")
+        self.ranking_query=dict()
+        if index is None:
+           index=self.build_inverted_index(corpus) # built once for all the queries
+        self.inverted_index=index
+        self.scorer=bm25.BM25Scorer(self.inverted_index, k1, b)
+
+        if isinstance(queries, list): # launch queries
+           for query_id, q in enumerate(queries):
+               self.bm25_ranking_function(corpus,q,query_id,self.top_k)
+        else:
+            self.bm25_ranking_function(corpus,queries,1,self.top_k)
+
+    #################################################################################
+    ## @brief   search
+    #  @details This method ranks the documents that contain any keyword of the query
+    #           with BM25 and returns the ids and scores of the top k documents. The
+    #           rankings are kept in the query cache, if there is one. It does not 
+    #           store the ranking, so it can be called by several threads at the same
+    #           time.
+    #  @param   q Query written in Natural Language.
+    #  @param   top_k Number of documents ranked (None ranks all the matching documents).
+    #  @param   drop_zeros Not used, only the matching documents are ranked.
+    #################################################################################   
+    def search(self,q, top_k=None, drop_zeros=False):
+        terms = self.preprocess_document(q)
+        if self.query_cache is None:
+           return self.scorer.top_k(terms, top_k)
+        key = self.query_cache.key(terms, (8, self.scorer.k1, self.scorer.b), top_k, False, self.inverted_index.uid)
+        ranking = self.query_cache.get(key)
+        if ranking is None:
+           ranking = self.query_cache.put(key, self.scorer.top_k(terms, top_k))
+        return ranking
+
+    #################################################################################
+    ## @brief   bm25_ranking_function
+    #  @details This method ranks the documents that contain any keyword of the query
+    #           with BM25 and stores the ranking of the top k documents.
+    #  @param   corpus Set of documents to be processed.
+    #  @param   q Query written in Natural Language.
+    #  @param   query_id The id of the query.
+    #  @param   top_k Number of documents ranked (None ranks all the matching documents).
+    #################################################################################   
+    def bm25_ranking_function(self,corpus, q, query_id, top_k=None):
+        ids, scores = self.search(q, top_k)
+        self.ranking_query[query_id]=list(zip(ids.tolist(), scores.tolist()))
+        self.print_ranking(corpus, q, ids, scores)
+        return ids, scores
         
         
              
@@ -2,59 +2,81 @@
 import ir_system    
 import rocchio_algorithm
 import ir_evaluator
+import ir_index
+import corpus_reader
 import sys
-import re
 import os
-import csv
+
+IR_MODELS = ['Boolean', 'TF', 'TF-IDF', 'LDA', 'LDA Multicore', 'LSI', 'RP', 'LogEntropyModel', 'BM25'] # names by model id
+
+#################################################################################
+## @brief   read_texts
+#  @details This method reads a file with a set of texts (MED format, JSON lines or
+#           their gzip versions) and returns the texts and their ids (the .I ids) 
+#           in two lists
+#  @param   path The path of the file
+#################################################################################  
+def read_texts(path):
+    ids, texts = corpus_reader.read_corpus(path)
+    return texts, ids
+
 #################################################################################
 ## @brief   preprocess_input
-#  @details This method reads user input and transform it into a list
+#  @details This method reads user input and transform it into a list. It returns
+#           the texts, their ids (None for a single text) and the id of the single
+#           text (None for a file)
 #  @param   user_input The input given by the user
 #################################################################################  
 def preprocess_userinput(user_input):
     path=user_input[:-8]  # Erase the file name and keep the path
     if os.path.exists(path): # the user has provided a file path with a set of texts
        try:
-           list_texts = re.split(".I \d*\n.W\n",open(user_input).read())[1:] # Split text file with the delimiter, erase first delimiter
-           return list_texts
+           texts, ids = read_texts(user_input)
+           return texts, ids, None
        except IOError:
-            print user_input + " - No such file or directory"
+            print(user_input + " - No such file or directory")
             sys.exit(0)
     else: 
        only_query_id = raw_input("Write the ID of the query provided:\n")  # the user has provided a query or a text    
-       return user_input, only_query_id
+       return user_input, None, only_query_id
 
 #################################################################################
 ## @brief   create_ir_system
 #  @details This method creates an information retrieval system with the model 
 #           chosen by the user
 #  @param   irmodel_choice The id of the information retrieval model chosen by the user
+#  @param   options The options of the information retrieval system (e.g. verbose)
 #################################################################################  
-def create_ir_system(irmodel_choice,corpus,query):
+def create_ir_system(irmodel_choice,corpus,query,**options):
     if irmodel_choice == 0:
-       return ir_system.IRBoolean(corpus,query)
+       return ir_system.IRBoolean(corpus,query,**options)
     elif irmodel_choice == 1:
-       return ir_system.IR_tf(corpus,query)
+       return ir_system.IR_tf(corpus,query,**options)
     elif irmodel_choice == 2:
-       return ir_system.IR_tf_idf(corpus,query)
+       return ir_system.IR_tf_idf(corpus,query,**options)
     elif irmodel_choice == 3:
-       return ir_system.IR_Lda(corpus,query)
+       return ir_system.IR_Lda(corpus,query,**options)
     elif irmodel_choice == 4:
-       return ir_system.IR_Lda_Multicore(corpus,query)
+       return ir_system.IR_Lda_Multicore(corpus,query,**options)
     elif irmodel_choice == 5:
-       return ir_system.IR_Lsi(corpus,query)
+       return ir_system.IR_Lsi(corpus,query,**options)
     elif irmodel_choice == 6:
-       return ir_system.IR_Rp(corpus,query)
+       return ir_system.IR_Rp(corpus,query,**options)
     elif irmodel_choice == 7:
-       return ir_system.IR_LogEntropyModel(corpus,query)
+       return ir_system.IR_LogEntropyModel(corpus,query,**options)
+    elif irmodel_choice == 8:
+       return ir_system.IR_BM25(corpus,query,**options)
 
 #################################################################################
 ## @brief   execute_IRsystem_prompt
 #  @details This method is used to interact with the user to execute their preferences  
+#  @param   doc_ids The ids of the documents (e.g. the .I ids), or None if they are 
+#           numbered from 1
+#  @param   query_ids The ids of the queries, or None if they are numbered from 1
 #################################################################################  
-def execute_IRsystem_prompt(corpus_text,query_text,only_query_id):
+def execute_IRsystem_prompt(corpus_text,query_text,only_query_id,doc_ids=None,query_ids=None):
 
-    print("\n The available models are: \n 0:Boolean\n 1:TF\n 2:TF-IDF\n 3:LDA\n 4:LDA Multicore\n 5:LSI\n 6:RP\n 7:LogEntropyModel\n \n")
+    print("\n The available models are: \n" + "".join(" %d:%s\n" % (model_id, name) for model_id, name in enumerate(IR_MODELS)) + " \n")
     irmodel_choice = raw_input("Please, choose an information retrieval model by entering the id of the model:\n") 
 
     ir = create_ir_system(int(irmodel_choice),corpus_text,query_text)
@@ -63,28 +85,71 @@ def execute_IRsystem_prompt(corpus_text,query_text,only_query_id):
    
     if((irevaluator_choice=="YES") | (irevaluator_choice=="yes") ):
        relevances_input = raw_input("Write the directory path with the document relevances:\n") 
-       with open(relevances_input, 'rb') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-            relevances=[]
-            for row in spamreader:
-                relevances.append(row)
+       relevances = ir_evaluator.read_qrels(relevances_input,doc_ids) # relevant documents indexed by query
 
-       ir_evaluator.IREvaluator(relevances,ir.ranking_query,True,only_query_id)
+       ir_evaluator.IREvaluator(relevances,ir.ranking_query,True,only_query_id,query_ids=query_ids)
 
     continue_choice = raw_input("Do you want to execute another IR model (YES/NO)? \n")
 
     if((continue_choice=="YES") | (continue_choice=="yes")):
-         execute_IRsystem_prompt(corpus_text,query_text,only_query_id) # Call the method recursively
+         execute_IRsystem_prompt(corpus_text,query_text,only_query_id,doc_ids,query_ids) # Call the method recursively
     else: 
-         ir_evaluator.IREvaluator(relevances,ir.ranking_query,False,only_query_id)
+         ir_evaluator.IREvaluator(relevances,ir.ranking_query,False,only_query_id,query_ids=query_ids)
     return ir
  
+#################################################################################
+## @brief   evaluate_all_models
+#  @details This method runs the queries with every model, without prompts nor
+#           printed rankings, over the corpus preprocessed once, and writes the 
+#           P/R curves (PDF) and the evaluation measures (JSON/CSV) in the output 
+#           directory instead of showing them.
+#  @param   corpus_text Set of documents to be processed.
+#  @param   query_text List of queries, in the order of the relevance assessments.
+#  @param   relevances_path The path of the relevance assessments file.
+#  @param   output_dir The directory of the report.
+#  @param   doc_ids The ids of the documents (e.g. the .I ids), in corpus order, or
+#           None if they are numbered from 1.
+#  @param   query_ids The ids of the queries, in file order, or None if they are
+#           numbered from 1.
+#################################################################################  
+def evaluate_all_models(corpus_text,query_text,relevances_path,output_dir,doc_ids=None,query_ids=None):
+    relevances = ir_evaluator.read_qrels(relevances_path,doc_ids)
+    shared = ir_system.IRSystem(corpus_text,query_text)
+    corpus_view = shared.create_corpus_view(corpus_text) # preprocessed once for all the models
+    runs = []
+    for irmodel_choice, name in enumerate(IR_MODELS):
+        ir = create_ir_system(irmodel_choice,corpus_text,query_text,corpus_view=corpus_view,verbose=False)
+        ranking_ids = ir_evaluator.ranking_query_ids(ir.ranking_query,query_ids=query_ids)
+        runs.append((name, ir_evaluator.evaluate_rankings(relevances,ir.ranking_query,ranking_ids)))
+    summaries = ir_evaluator.write_report(runs,output_dir)
+    for name, summary in summaries:
+        print("%-16s MAP = %.3f  P@10 = %.3f" % (name, summary['MAP'], summary['P@10']))
+    return summaries
+
+#################################################################################
+## @brief   judge_documents
+#  @details This method asks the user whether each ranked document is relevant and
+#           returns the ids of the relevant and non relevant documents
+#  @param   ranking The ranked (document position, score) pairs to be judged
+#  @param   doc_ids The ids of the documents shown to the user, or None to show 
+#           their positions
+#################################################################################  
+def judge_documents(ranking,doc_ids=None):
+    relevant, non_relevant = [], []
+    for doc, score in ranking:
+        answer = raw_input("Is relevant the document ID "  + str(doc if doc_ids is None else doc_ids[doc]) +  " (Y/N)?")
+        if (answer == 'y') or (answer == 'Y'):
+           relevant.append(doc)
+        else:
+           non_relevant.append(doc)
+    return relevant, non_relevant
+
 #################################################################################
 ## @brief   execute_Rocchio_prompt
 #  @details This method is used to interact with the user to execute the rocchio 
 #           algorithm evaluation  
 #################################################################################               
-def execute_Rocchio_prompt(query_text,corpus_text,ir,only_query_id):
+def execute_Rocchio_prompt(query_text,corpus_text,ir,only_query_id,doc_ids=None,query_ids=None):
      rocchio_choice = raw_input("Do you want to execute the rocchio algorithm optimization (YES/NO)? \n")
      if((rocchio_choice=="YES" ) | (rocchio_choice=="yes")):
          print("------------Executing Rocchio Algorithm------------")
@@ -92,27 +157,38 @@ def execute_Rocchio_prompt(query_text,corpus_text,ir,only_query_id):
          user_improvement = raw_input("Please, choose the X (e.g. X=20) first documents in the ranking and marks them as being relevant or non relevant according to the relevance assessments in MED.REL  \n")
          
          
-         rankings = [list(i) for i in ir.ranking_query[1]] # convert to a list
-         pos=0
-         while pos < 20:
-              answer = raw_input("Is relevant the document ID "  + str(rankings[pos][0]) +  " (Y/N)?")
-              if (answer == 'y') or (answer == 'Y'):
-                 rankings[pos][1] = 1      
-              pos += 1          
+         if not isinstance(getattr(ir, 'index', None), ir_index.IRIndex):
+            print("The Rocchio algorithm needs a vector model (TF, TF-IDF, LDA, LSI, RP or LogEntropyModel)")
+            return
+         relevant, non_relevant = judge_documents(ir.ranking_query[1][:20],doc_ids)
          #5) According these relevance judgements, the system updates the original query based on Rocchio's formula.
-         rocchio = rocchio_algorithm.RocchioAlgorithm(query_text,corpus_text,rankings,ir)
-         #6) The system launchs the new query and presents a new ranking.
+         rocchio = rocchio_algorithm.RocchioAlgorithm(query_text,ir,relevant,non_relevant)
+         #6) The system launchs the new query and presents a new ranking over the same index.
          #7) A new P/R curve is generated and compared to the previous one. 
          answer = 'y'
          while ((answer == 'y') or (answer == 'Y')):                
-                 ir = execute_IRsystem_prompt(corpus_text,rocchio.new_query,only_query_id)
+                 ir.ranking_query[1] = list(zip(rocchio.ids.tolist(), rocchio.scores.tolist()))
+                 ir.print_ranking(corpus_text, rocchio.new_query, rocchio.ids, rocchio.scores)
+                 irevaluator_choice = raw_input("Do you want to execute the performance evaluation of the new ranking (YES/NO)? \n")
+                 if((irevaluator_choice=="YES") | (irevaluator_choice=="yes") ):
+                    relevances_input = raw_input("Write the directory path with the document relevances:\n") 
+                    ir_evaluator.IREvaluator(ir_evaluator.read_qrels(relevances_input,doc_ids),ir.ranking_query,True,only_query_id,query_ids=query_ids)
                  answer = raw_input("Do you want to execute again the rocchio optimization algorithm (Y/N)?") # desired recall and precision to be chosen by the user
+                 if ((answer == 'y') or (answer == 'Y')):
+                    relevant, non_relevant = judge_documents(ir.ranking_query[1][:20],doc_ids)
+                    rocchio.feedback(relevant,non_relevant)
      return 
 
 ####################################################################################################################### 
 ## @brief The main function that enables the user to launch queries
 ####################################################################################################################### 
 if __name__ == '__main__':
+
+      if len(sys.argv) == 6 and sys.argv[1] == '--report': # main.py --report corpus queries relevances output_dir
+         corpus_text, doc_ids = read_texts(sys.argv[2])
+         query_text, query_ids = read_texts(sys.argv[3])
+         evaluate_all_models(corpus_text,query_text,sys.argv[4],sys.argv[5],doc_ids,query_ids)
+         sys.exit(0)
    
       print("--------------------------------------------------------\n")
       print("------------ Project: Information Retrieval System\n")
@@ -122,11 +198,11 @@ if __name__ == '__main__':
       print("--------------------------------------------------------\n")
       
       corpus_input = raw_input("Write a text or enter the corpus path:\n") 
-      corpus_text=preprocess_userinput(corpus_input)
+      corpus_text, doc_ids, only_doc_id=preprocess_userinput(corpus_input)
     
       query_input = raw_input("Write a query or enter a document path with a set of queries:\n") 
-      query_text, only_query_id=preprocess_userinput(query_input)
+      query_text, query_ids, only_query_id=preprocess_userinput(query_input)
 
-      ir = execute_IRsystem_prompt(corpus_text,query_text,only_query_id)
-      rocchio = execute_Rocchio_prompt(query_text,corpus_text,ir,only_query_id)
+      ir = execute_IRsystem_prompt(corpus_text,query_text,only_query_id,doc_ids,query_ids)
+      rocchio = execute_Rocchio_prompt(query_text,corpus_text,ir,only_query_id,doc_ids,query_ids)
 
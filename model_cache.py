@@ -0,0 +1,129 @@
+###################################################################################
+## @file      model_cache.py
+#  @brief     The model_cache.py keeps the trained models (TF-IDF, LDA, LSI, RP,
+#             LogEntropy) so that they are trained once per corpus and parameters.
+#             The models are kept in an in-memory LRU cache and, optionally, saved
+#             on disk with the gensim save/load methods.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import json
+import os
+
+DEFAULT_MAX_MODELS = 8 # models kept in memory
+
+#################################################################################
+## @brief   bow_fingerprint
+#  @details This method returns the SHA-1 fingerprint of the bag-of-words corpus.
+#  @param   bow The documents in bag-of-words format.
+#################################################################################
+def bow_fingerprint(bow):
+    sha = hashlib.sha1()
+    for vector in bow:
+        sha.update(np.asarray(vector, dtype=np.int64).tobytes())
+        sha.update(b'\0') # document separator
+    return sha.hexdigest()
+
+#################################################################################
+## @brief   dictionary_fingerprint
+#  @details This method returns the SHA-1 fingerprint of the token ids of the dictionary.
+#  @param   dictionary The dictionary with the documents keywords.
+#################################################################################
+def dictionary_fingerprint(dictionary):
+    sha = hashlib.sha1()
+    for token, token_id in sorted(dictionary.token2id.items()):
+        sha.update((u'%s\t%d\n' % (token, token_id)).encode('utf-8'))
+    return sha.hexdigest()
+
+###################################################################################
+## @class   ModelCache
+#  @brief   This class represents the cache of trained models. A model is identified
+#           by the fingerprints of the corpus and the dictionary, the model class and
+#           its hyperparameters.
+###################################################################################
+class ModelCache(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   max_models The maximum number of models kept in memory.
+    #################################################################################
+    def __init__(self, max_models=DEFAULT_MAX_MODELS):
+        self.max_models = max_models
+        self.models = OrderedDict() # key -> model, ordered from least to most recently used
+
+    #################################################################################
+    ## @brief   key
+    #  @details This method returns the key of the model in the cache.
+    #  @param   model_class The gensim model class.
+    #  @param   params The hyperparameters of the model.
+    #  @param   bow The documents in bag-of-words format.
+    #  @param   dictionary The dictionary with the documents keywords.
+    #################################################################################
+    def key(self, model_class, params, bow, dictionary):
+        description = {'class': model_class.__module__ + '.' + model_class.__name__,
+                       'params': params,
+                       'corpus': bow_fingerprint(bow),
+                       'dictionary': dictionary_fingerprint(dictionary)}
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+    #################################################################################
+    ## @brief   get
+    #  @details This method returns the cached model, loading it from the directory if
+    #           it is not in memory, or None if it has not been trained.
+    #################################################################################
+    def get(self, key, model_class, directory=None):
+        model = self.models.pop(key, None)
+        if model is None and directory is not None:
+           path = os.path.join(directory, key)
+           if os.path.exists(path):
+              model = model_class.load(path)
+        if model is not None:
+           self.put(key, model)
+        return model
+
+    #################################################################################
+    ## @brief   put
+    #  @details This method stores the model in memory (evicting the least recently
+    #           used model) and, if a directory is given, on disk.
+    #################################################################################
+    def put(self, key, model, directory=None):
+        self.models.pop(key, None)
+        if len(self.models) >= self.max_models:
+           self.models.popitem(last=False)
+        self.models[key] = model
+        if directory is not None:
+           if not os.path.exists(directory):
+              os.makedirs(directory)
+           model.save(os.path.join(directory, key))
+
+    #################################################################################
+    ## @brief   get_or_train
+    #  @details This method returns the cached model or trains it and caches it.
+    #  @param   model_class The gensim model class.
+    #  @param   bow The documents in bag-of-words format.
+    #  @param   dictionary The dictionary with the documents keywords.
+    #  @param   params The hyperparameters of the model.
+    #  @param   directory The directory where the models are saved, or None.
+    #################################################################################
+    def get_or_train(self, model_class, bow, dictionary, params, directory=None):
+        key = self.key(model_class, params, bow, dictionary)
+        model = self.get(key, model_class, directory)
+        if model is None:
+           model = model_class(bow, **params)
+           self.put(key, model, directory)
+        return model
+
+_default_model_cache = None
+
+#################################################################################
+## @brief   default_model_cache
+#  @details This method returns the model cache shared by the information retrieval
+#           models. It is created the first time it is requested.
+#################################################################################
+def default_model_cache():
+    global _default_model_cache
+    if _default_model_cache is None:
+       _default_model_cache = ModelCache()
+    return _default_model_cache
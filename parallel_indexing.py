@@ -0,0 +1,100 @@
+###################################################################################
+## @file      parallel_indexing.py
+#  @brief     The parallel_indexing.py builds the dictionary and the bag-of-words
+#             documents with a pool of processes. The corpus is sharded into chunks,
+#             each worker analyzes its chunk and builds a partial dictionary, and the
+#             partial dictionaries are merged with the same ids as the serial path.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from gensim import corpora
+import multiprocessing
+
+CHUNKS_PER_PROCESS = 4 # more chunks than processes to balance the load
+
+_worker_analyzer = None
+_worker_dictionary = None
+
+#################################################################################
+## @brief   chunks
+#  @details This method splits the items into consecutive chunks, so that the
+#           chunks can be processed in parallel and concatenated in order.
+#  @param   items The list to be split.
+#  @param   processes The number of processes that will share the chunks.
+#################################################################################
+def chunks(items, processes):
+    size = max(1, -(-len(items) // (processes * CHUNKS_PER_PROCESS)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+#################################################################################
+## @brief   merge_dictionaries
+#  @details This method merges the partial dictionaries of consecutive chunks. The
+#           new tokens of each chunk are added in the order of its local ids, which
+#           gives the ids the serial corpora.Dictionary would have assigned.
+#  @param   partials The dictionaries of the chunks, in corpus order.
+#################################################################################
+def merge_dictionaries(partials):
+    dictionary = corpora.Dictionary()
+    for partial in partials:
+        for token in sorted(partial.token2id, key=partial.token2id.get):
+            local_id = partial.token2id[token]
+            token_id = dictionary.token2id.get(token)
+            if token_id is None:
+               token_id = len(dictionary.token2id)
+               dictionary.token2id[token] = token_id
+            dictionary.dfs[token_id] = dictionary.dfs.get(token_id, 0) + partial.dfs[local_id]
+            dictionary.cfs[token_id] = dictionary.cfs.get(token_id, 0) + partial.cfs[local_id]
+        dictionary.num_docs += partial.num_docs
+        dictionary.num_pos += partial.num_pos
+        dictionary.num_nnz += partial.num_nnz
+    return dictionary
+
+def _init_worker(analyzer, dictionary):
+    global _worker_analyzer, _worker_dictionary
+    _worker_analyzer = analyzer
+    _worker_dictionary = dictionary
+
+def _analyze_chunk(docs):
+    pdocs = _worker_analyzer.analyze_many(docs)
+    return pdocs, corpora.Dictionary(pdocs)
+
+def _docs2bows_chunk(pdocs):
+    return [_worker_dictionary.doc2bow(doc) for doc in pdocs]
+
+#################################################################################
+## @brief   run_pool
+#  @details This method applies the function to every chunk with a pool of processes
+#           and returns the results in chunk order.
+#################################################################################
+def run_pool(function, items, processes, analyzer=None, dictionary=None):
+    pool = multiprocessing.Pool(processes, _init_worker, (analyzer, dictionary))
+    try:
+        return pool.map(function, chunks(items, processes))
+    finally:
+        pool.close()
+        pool.join()
+
+#################################################################################
+## @brief   create_dictionary
+#  @details This method creates the dictionary and the taxonomy of keywords of each
+#           document using a pool of processes.
+#  @param   analyzer The text analyzer used to preprocess the documents.
+#  @param   docs The documents to be preprocessed
+#  @param   processes The number of processes.
+#################################################################################
+def create_dictionary(analyzer, docs, processes):
+    results = run_pool(_analyze_chunk, docs, processes, analyzer=analyzer)
+    pdocs = [pdoc for chunk_pdocs, partial in results for pdoc in chunk_pdocs]
+    dictionary = merge_dictionaries([partial for chunk_pdocs, partial in results])
+    return dictionary, pdocs
+
+#################################################################################
+## @brief   docs2bows
+#  @details This method converts the documents into the bag-of-words format using
+#           a pool of processes.
+#  @param   dictionary The dictionary with the documents keywords.
+#  @param   pdocs The taxonomy of keywords of each document.
+#  @param   processes The number of processes.
+#################################################################################
+def docs2bows(dictionary, pdocs, processes):
+    results = run_pool(_docs2bows_chunk, pdocs, processes, dictionary=dictionary)
+    return [bow for chunk_bows in results for bow in chunk_bows]
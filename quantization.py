@@ -0,0 +1,114 @@
+###################################################################################
+## @file      quantization.py
+#  @brief     The quantization.py stores the document vectors of the dense similarity
+#             index with fewer bytes per weight: float16 (half of float32) or int8
+#             with one float32 scale per document (a quarter). The documents are
+#             scored by blocks, so only one block is converted back to float32 at a
+#             time, and only over the features of the queries.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from gensim import matutils, utils
+import numpy as np
+
+QUANTIZED_TYPES = ('float16', 'int8')
+
+BLOCK_BYTES = 1 << 20 # float32 weights dequantized at a time, small enough to stay in the cache
+
+#################################################################################
+## @brief   quantize
+#  @details This method returns the quantized rows of the matrix and their scales
+#           (None for float16). With int8, every row is divided by its largest
+#           absolute weight / 127 and rounded.
+#  @param   matrix The dense matrix, one document per row.
+#  @param   dtype The type of the weights: 'float16' or 'int8'.
+#################################################################################
+def quantize(matrix, dtype):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype == 'float16':
+       return matrix.astype(np.float16), None
+    if dtype == 'int8':
+       scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.shape[1] > 0 else np.ones(matrix.shape[0])
+       scales[scales == 0] = 1.0
+       return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError("Unknown quantized type: %s (available: %s)" % (dtype, ", ".join(QUANTIZED_TYPES)))
+
+###################################################################################
+## @class   QuantizedSimilarity
+#  @brief   This class represents the dense similarity index with quantized weights.
+#           It scores the queries as the gensim MatrixSimilarity (cosine of the
+#           L2-normalised vectors) and it is saved and loaded in the same way.
+###################################################################################
+class QuantizedSimilarity(utils.SaveLoad):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   matrix The dense matrix of the L2-normalised documents.
+    #  @param   dtype The type of the weights: 'float16' or 'int8'.
+    #################################################################################
+    def __init__(self, matrix, dtype):
+        self.dtype = dtype
+        self.values, self.scales = quantize(matrix, dtype)
+        self.num_features = self.values.shape[1]
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    #################################################################################
+    ## @brief   score_block
+    #  @details This method returns the scores (queries x documents) of the dense
+    #           L2-normalised queries, one block of documents at a time. Only the
+    #           features with a weight in some query are dequantized.
+    #  @param   queries The dense matrix of the queries (queries x features).
+    #################################################################################
+    def score_block(self, queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        features = np.flatnonzero(np.any(queries != 0, axis=0))
+        block_size = max(1, BLOCK_BYTES // (4 * max(1, len(features))))
+        if len(features) == self.num_features: # dense queries (topic models)
+           features = slice(None)
+        queries = queries[:, features]
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), block_size):
+            block = self.values[start:start + block_size, features].astype(np.float32)
+            scores[:, start:start + block_size] = np.dot(queries, block.T)
+        if self.scales is not None:
+           scores *= self.scales # the scale of every document multiplies its scores
+        return scores
+
+    #################################################################################
+    ## @brief   __getitem__
+    #  @details This method returns the cosine of the query with every document.
+    #  @param   query The weighted query vector, list of (feature id, weight) 2-tuples.
+    #################################################################################
+    def __getitem__(self, query):
+        vector = matutils.sparse2full(query, self.num_features)
+        norm = np.sqrt(np.dot(vector, vector))
+        if norm > 0:
+           vector /= norm
+        return self.score_block(vector[None, :])[0]
+
+    #################################################################################
+    ## @brief   append
+    #  @details This method appends the quantized vectors of new documents. The
+    #           vectors of the documents are padded with zeros if the new documents
+    #           have more features (new terms of the dictionary).
+    #  @param   matrix The dense matrix of the L2-normalised new documents.
+    #  @param   num_features The number of features of the index.
+    #################################################################################
+    def append(self, matrix, num_features):
+        values, scales = quantize(matrix, self.dtype)
+        old = np.zeros((len(self), num_features), dtype=self.values.dtype)
+        old[:, :self.num_features] = self.values
+        new = np.zeros((values.shape[0], num_features), dtype=self.values.dtype)
+        new[:, :values.shape[1]] = values
+        self.values = np.vstack([old, new])
+        if self.scales is not None:
+           self.scales = np.concatenate([self.scales, scales])
+        self.num_features = num_features
+
+    #################################################################################
+    ## @brief   nbytes
+    #  @details This method returns the memory of the quantized vectors in bytes.
+    #################################################################################
+    def nbytes(self):
+        return self.values.nbytes + (0 if self.scales is None else self.scales.nbytes)
@@ -0,0 +1,115 @@
+###################################################################################
+## @file      query_cache.py
+#  @brief     The query_cache.py keeps the rankings of the queries already executed,
+#             so that a repeated query is answered without weighting it and scoring
+#             it against the index. A ranking is identified by the analyzed query
+#             (its bag of keywords), the ranking model, the number of documents
+#             ranked and the identity of the index, which is unique to every built
+#             index and renewed when its documents change, so a cache can be shared
+#             by several indexes and the rankings computed before documents are
+#             added or deleted are never returned. The rankings are
+#             kept in a bounded LRU cache and, optionally, expire after a time.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from collections import OrderedDict
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 10000 # rankings kept in memory
+
+###################################################################################
+## @class   QueryCache
+#  @brief   This class represents the cache of rankings, with the counters of hits,
+#           misses, evictions and expirations. It can be shared by several threads
+#           and by the models of several collections or settings.
+###################################################################################
+class QueryCache(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @param   max_entries The maximum number of rankings kept in memory.
+    #  @param   ttl The seconds a ranking is kept (None keeps it until it is evicted).
+    #  @param   clock The function that returns the current time in seconds.
+    #################################################################################
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict() # key -> (ranking, expiry), ordered from least to most recently used
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    #################################################################################
+    ## @brief   key
+    #  @details This method returns the key of the ranking in the cache. The bag of
+    #           keywords does not depend on their order in the query.
+    #  @param   bag The analyzed query: keywords, or (term id, count) 2-tuples.
+    #  @param   mode The id of the ranking model (and its parameters, if any).
+    #  @param   top_k Number of documents ranked (None ranks all of them).
+    #  @param   drop_zeros If True, the documents with score 0 are not ranked.
+    #  @param   index_id The identity of the index and of the version of its documents
+    #           (IRIndex.cache_id(), or the uid of the inverted index).
+    #################################################################################
+    def key(self, bag, mode, top_k, drop_zeros, index_id):
+        return (tuple(sorted(bag)), mode, top_k, drop_zeros, index_id)
+
+    #################################################################################
+    ## @brief   get
+    #  @details This method returns the cached ranking, or None if it is not cached or
+    #           it has expired.
+    #  @param   key The key of the ranking.
+    #################################################################################
+    def get(self, key):
+        with self.lock:
+             entry = self.entries.pop(key, None)
+             if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+                self.expirations += 1
+                entry = None
+             if entry is None:
+                self.misses += 1
+                return None
+             self.entries[key] = entry
+             self.hits += 1
+             return entry[0]
+
+    #################################################################################
+    ## @brief   put
+    #  @details This method stores the ranking, evicting the least recently used one.
+    #           The arrays of the ranking are made read-only, since they are shared
+    #           by every caller of the same query.
+    #  @param   key The key of the ranking.
+    #  @param   ranking The (ids, scores) arrays of the ranking.
+    #################################################################################
+    def put(self, key, ranking):
+        for array in ranking:
+            array.setflags(write=False)
+        expiry = None if self.ttl is None else self.clock() + self.ttl
+        with self.lock:
+             self.entries.pop(key, None)
+             while len(self.entries) >= self.max_entries and len(self.entries) > 0:
+                 self.entries.popitem(last=False)
+                 self.evictions += 1
+             if self.max_entries > 0:
+                self.entries[key] = (ranking, expiry)
+        return ranking
+
+    #################################################################################
+    ## @brief   clear
+    #  @details This method removes every ranking (the counters are kept).
+    #################################################################################
+    def clear(self):
+        with self.lock:
+             self.entries.clear()
+
+    #################################################################################
+    ## @brief   stats
+    #  @details This method returns the counters of the cache and its hit rate.
+    #################################################################################
+    def stats(self):
+        with self.lock:
+             lookups = self.hits + self.misses
+             return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                     'expirations': self.expirations, 'hit_rate': self.hits / float(lookups) if lookups > 0 else 0.0}
@@ -1,70 +1,186 @@
+###################################################################################
+## @file      rocchio_algorithm.py
+#  @brief     The rocchio_algorithm.py reformulates a query with the relevance
+#             judgments of its ranked documents (Rocchio's formula) and ranks the
+#             documents again with the modified query vector, over the index
+#             already built for the ranking model.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import numpy as np
+import scipy.sparse
+import ir_index
+
 class RocchioAlgorithm(object):
-    """description of class"""
+    """Rocchio's relevance feedback: Q_m = a Q_o + b centroid(D_r) - c centroid(D_nr)"""
     #################################################################################
     ## @brief   Constructor
     #  @details This method initializes the class with:
-    #           corpus set of the documents to be searched
-    #           relevance_judgments ID's of the relevant documents
-    #################################################################################    
-    def __init__(self,query,corpus,relevance_judgments,ir):
-        dictionary,pdocs = ir.create_dictionary(corpus)
-        queryVector = ir.create_query_view(query,dictionary)        
-        query_mod = self.execute_rocchio(dictionary,relevance_judgments, queryVector, 1, .75, .15)
-        self.new_query = self.getNewQuery(query, query_mod, dictionary)
-
-
-    def getQueryVector(self,query,dictionary):
-        queryVector = [0] * len(dictionary)
-        for word in query.split():
-		    pos = dictionary[word]
-		    queryVector[pos] = queryVector[pos] + 1
-        return queryVector	
-
-    def execute_rocchio(self,dictionary,relevance, queryVector, alpha, beta, gamma):
-        
-        relDocs = [relevance[i] for i in range(len(relevance)) if relevance[i][1] > 0.1] 
-        nonRelDocs = [relevance[i] for i in range(len(relevance)) if relevance[i][1] <= 0.1] # weights less than 0.1 are considered no relevant
+    #           query                The original query written in Natural Language
+    #           ir                   The information retrieval system, with the index
+    #                                of its model (TF, TF-IDF, LogEntropy, LDA, LSI, RP)
+    #           relevant             The ids of the documents judged relevant
+    #           non_relevant         The ids of the documents judged non relevant
+    #           alpha, beta, gamma   The weights of the query and of the centroids
+    #           num_terms            The number of expansion terms added to the query
+    #           top_k                Number of documents ranked (None ranks all of them)
+    #################################################################################
+    def __init__(self,query,ir,relevant=(),non_relevant=(),alpha=1.0,beta=0.75,gamma=0.15,num_terms=2,top_k=None):
+        self.index = getattr(ir, 'index', None)
+        if not isinstance(self.index, ir_index.IRIndex):
+           raise ValueError("Rocchio's feedback needs the vector index of the TF, TF-IDF, LogEntropy, LDA, LSI or RP models")
+        self.alpha, self.beta, self.gamma = alpha, beta, gamma
+        self.num_terms = num_terms
+        self.top_k = top_k
+        self.dictionary = self.index.dictionary
+        vq = ir.create_query_view(query, self.dictionary)
+        self.query_terms = set(term_id for term_id, count in vq)
+        self.query_vector = ir_index.normalized_matrix([self.index.weight_query(vq)], self.index.num_features)
+        self.new_query = query
+        self.expansion_terms = []
+        if len(relevant) > 0 or len(non_relevant) > 0:
+           self.feedback(relevant, non_relevant)
 
-        term1 = [alpha*i for i in queryVector]
+    #################################################################################
+    ## @brief   document_vectors
+    #  @details This method returns the L2-normalised vectors of the documents as they
+    #           are stored in the index (CSR matrix, one row per document).
+    #  @param   docs The ids of the documents.
+    #################################################################################
+    def document_vectors(self,docs):
+        return ir_index.normalized_matrix(self.index.weight_documents([self.index.bow[doc] for doc in docs]), self.index.num_features)
 
-        sumRelDocs=0
-        for i in relDocs:
-            sumRelDocs  += i[1]
+    #################################################################################
+    ## @brief   term_vectors
+    #  @details This method returns the vectors of the documents over the terms of the
+    #           dictionary: the stored vectors of the TF, TF-IDF and LogEntropy models,
+    #           or the TF vectors for the topic models.
+    #  @param   docs The ids of the documents.
+    #################################################################################
+    def term_vectors(self,docs):
+        if self.index.mode in ir_index.SPARSE_MODES:
+           return self.document_vectors(docs)
+        return ir_index.normalized_matrix([ir_index.tf_weights(self.index.bow[doc]) for doc in docs], len(self.dictionary))
 
-        sumNonRelDocs=0
-        for j in nonRelDocs:
-            sumNonRelDocs  += j[1]
+    #################################################################################
+    ## @brief   centroid
+    #  @details This method returns the mean of the rows of the sparse matrix as a
+    #           sparse row (zero if there are no rows).
+    #  @param   vectors The CSR matrix of the document vectors.
+    #################################################################################
+    def centroid(self,vectors):
+        if vectors.shape[0] == 0:
+           return scipy.sparse.csr_matrix((1, vectors.shape[1]))
+        return scipy.sparse.csr_matrix(np.full((1, vectors.shape[0]), 1.0 / vectors.shape[0])).dot(vectors)
 
-        term2 = [float(beta)/len(relDocs) * sumRelDocs]
-        term3 = [-float(gamma)/len(nonRelDocs) * sumNonRelDocs]
-        
-        term1 = [list(i) for i in term1] # convert to a list    
-                      
-        pos=0   
-        while pos < len(term1):
-              term1[pos][1] = term1[pos][1] + term2[0] + term3[0]
-              pos += 1  
-        return term1
-	    # modQueryVec = [sum(term1) for wordCol in zip(term1,term2,term3)]
-	    # modQueryVec = [sum(wordCol) for wordCol in zip(term1,term2,term3)]
+    #################################################################################
+    ## @brief   execute_rocchio
+    #  @details This method returns the Rocchio combination of the query vector with
+    #           the centroids of the relevant and non relevant documents. The negative
+    #           weights are removed.
+    #################################################################################
+    def execute_rocchio(self,query_vector,relevant_vectors,non_relevant_vectors):
+        num_features = max(query_vector.shape[1], relevant_vectors.shape[1], non_relevant_vectors.shape[1])
+        resize = lambda matrix: scipy.sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(1, num_features))
+        modified = (self.alpha * resize(query_vector) + self.beta * resize(self.centroid(relevant_vectors))
+                    - self.gamma * resize(self.centroid(non_relevant_vectors))).tocsr()
+        modified.data = np.maximum(modified.data, 0)
+        modified.eliminate_zeros()
+        return modified
 
+    #################################################################################
+    ## @brief   select_expansion_terms
+    #  @details This method returns the ids of the terms with the highest positive
+    #           weights that are not in the query.
+    #  @param   term_weights The sparse row with the weight of every term.
+    #################################################################################
+    def select_expansion_terms(self,term_weights):
+        candidates = np.array([term_id not in self.query_terms for term_id in term_weights.indices], dtype=bool)
+        term_ids, weights = term_weights.indices[candidates], term_weights.data[candidates]
+        positive = weights > 0
+        term_ids, weights = term_ids[positive], weights[positive]
+        if len(term_ids) > self.num_terms:
+           best = np.argpartition(-weights, self.num_terms - 1)[:self.num_terms]
+           term_ids, weights = term_ids[best], weights[best]
+        return term_ids[np.argsort(-weights, kind='mergesort')].tolist()
 
-    def getKey(self,item):
-        return item[1]
+    #################################################################################
+    ## @brief   feedback
+    #  @details This method runs one round of relevance feedback: the query vector is
+    #           modified with the judged documents, the expansion terms are chosen
+    #           and the documents are ranked with the modified vector. Every round
+    #           starts from the query vector of the previous round. It returns the ids
+    #           and scores of the new ranking.
+    #  @param   relevant The ids of the documents judged relevant.
+    #  @param   non_relevant The ids of the documents judged non relevant.
+    #################################################################################
+    def feedback(self,relevant,non_relevant):
+        relevant, non_relevant = list(relevant), list(non_relevant)
+        self.query_vector = self.execute_rocchio(self.query_vector, self.document_vectors(relevant), self.document_vectors(non_relevant))
+        if self.index.mode in ir_index.SPARSE_MODES:
+           term_weights = self.query_vector
+        else:
+           term_weights = self.execute_rocchio(scipy.sparse.csr_matrix((1, len(self.dictionary))), self.term_vectors(relevant), self.term_vectors(non_relevant))
+        new_terms = self.select_expansion_terms(term_weights)
+        self.query_terms.update(new_terms)
+        self.expansion_terms.extend(self.dictionary[term_id] for term_id in new_terms)
+        self.new_query = self.getNewQuery(self.new_query, new_terms)
+        self.ids, self.scores = self.index.rank(self.query_weight(), self.top_k)
+        return self.ids, self.scores
 
-    def getNewQuery(self,query, queryMod, dictionary):
-	    # find 2 new words with maximum value
-        temp = queryMod[:]
-        temp.sort(reverse = True)
-        count = 0
-        for element in temp:
-            pos = queryMod.index(element)
-            word = dictionary[pos]
-            if word not in query:
-               query = query + ' ' + word
-               count = count + 1
-               if count==2:
-                   break
+    #################################################################################
+    ## @brief   query_weight
+    #  @details This method returns the modified query vector as a list of (feature id,
+    #           weight) 2-tuples, as the weighted queries scored by the index.
+    #################################################################################
+    def query_weight(self):
+        return list(zip(self.query_vector.indices.tolist(), self.query_vector.data.tolist()))
 
-        return query
+    #################################################################################
+    ## @brief   getNewQuery
+    #  @details This method appends the expansion terms (keywords of the dictionary) to
+    #           the text of the query.
+    #  @param   query The text of the query.
+    #  @param   term_ids The ids of the expansion terms.
+    #################################################################################
+    def getNewQuery(self,query,term_ids):
+        words = [self.dictionary[term_id] for term_id in term_ids]
+        if len(words) == 0:
+           return query
+        return query.rstrip() + ' ' + ' '.join(words)
 
+#################################################################################
+## @brief   pseudo_relevance_feedback
+#  @details This method expands every query with Rocchio's formula, taking the top
+#           documents of its first ranking as relevant (no document is judged non
+#           relevant), and ranks all the modified queries in one batched pass over
+#           the index of the model. The centroids of all the queries are computed
+#           with one sparse product: (queries x feedback documents) averaging
+#           matrix times the matrix of the feedback documents. It returns the 
+#           (ids, scores) ranking of every query.
+#  @param   ir The information retrieval system, with the index of its model.
+#  @param   queries List of queries written in Natural Language.
+#  @param   ranking_query The first ranking of each query (ids from 0, in order).
+#  @param   feedback_docs The number of top documents taken as relevant.
+#  @param   alpha The weight of the original query.
+#  @param   beta The weight of the centroid of the feedback documents.
+#  @param   top_k Number of documents ranked (None ranks all of them).
+#  @param   drop_zeros If True, the documents with score 0 are not ranked.
+#################################################################################
+def pseudo_relevance_feedback(ir,queries,ranking_query,feedback_docs=10,alpha=1.0,beta=0.75,top_k=None,drop_zeros=False):
+    index = getattr(ir, 'index', None)
+    if not isinstance(index, ir_index.IRIndex):
+       raise ValueError("Pseudo-relevance feedback needs the vector index of the TF, TF-IDF, LogEntropy, LDA, LSI or RP models")
+    query_matrix = ir_index.normalized_matrix([index.weight_query(ir.create_query_view(q, index.dictionary)) for q in queries],
+                                              index.num_features)
+    top_docs = [np.array([doc for doc, score in ranking_query[query][:feedback_docs]], dtype=np.intp) for query in range(len(queries))]
+    counts = np.array([len(docs) for docs in top_docs])
+    judged = np.concatenate(top_docs + [np.zeros(0, dtype=np.intp)])
+    docs = np.unique(judged)
+    doc_matrix = ir_index.normalized_matrix(index.weight_documents([index.bow[doc] for doc in docs]), index.num_features)
+    averaging = scipy.sparse.csr_matrix((np.repeat(1.0 / np.maximum(counts, 1), counts),
+                                         (np.repeat(np.arange(len(queries)), counts), np.searchsorted(docs, judged))),
+                                        shape=(len(queries), len(docs)))
+    modified = (alpha * query_matrix + beta * averaging.dot(doc_matrix)).tocsr()
+    query_weights = [list(zip(modified.indices[start:end].tolist(), modified.data[start:end].tolist()))
+                     for start, end in zip(modified.indptr[:-1], modified.indptr[1:])]
+    return index.rank_batch(query_weights, top_k, drop_zeros)
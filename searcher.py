@@ -0,0 +1,277 @@
+#!/usr/bin/python
+###################################################################################
+## @file      searcher.py
+#  @brief     The searcher.py serves queries over indexes built once: the Searcher
+#             keeps the models of a collection and ranks the queries of several
+#             threads at the same time, from a thread pool (search_many), from an
+#             asyncio event loop (search_async) or from a local HTTP endpoint.
+#
+#             python searcher.py --corpus corpus/MED.ALL --models tf_idf bm25 --port 8000
+#             curl "http://127.0.0.1:8000/search?q=heart+disease&model=bm25&k=5"
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import corpus_reader
+import ir_batch
+import ir_system
+import query_cache
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError: # Python 2 without the futures package
+    ThreadPoolExecutor = None
+try:
+    import asyncio
+except ImportError: # Python 2
+    asyncio = None
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError: # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+DEFAULT_K = 10 # documents returned per query
+
+###################################################################################
+## @class   Searcher
+#  @brief   This class represents a long-lived searcher over a collection. The
+#           indexes of the models are built once in the constructor and they are
+#           only read afterwards: search() keeps no state per query, so it can be
+#           called by several threads at the same time.
+###################################################################################
+class Searcher(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @details This method builds the index of every model (the Boolean and BM25
+    #           models share the inverted index). The collection is preprocessed once,
+    #           and only if an index cannot be loaded from the index directory.
+    #  @param   corpus The documents of the collection.
+    #  @param   models The names or ids of the models ('all' selects every model).
+    #  @param   doc_ids The ids of the documents, in corpus order (None returns the
+    #           positions of the documents, from 0).
+    #  @param   workers The number of threads of the pool (by default, one per core).
+    #  @param   options The options of the information retrieval systems (e.g.
+    #           index_dir, query_cache).
+    #################################################################################
+    def __init__(self, corpus, models=('all',), doc_ids=None, workers=None, **options):
+        self.corpus = corpus
+        self.doc_ids = doc_ids
+        self.workers = workers or multiprocessing.cpu_count()
+        self.executor = None
+        self.query_cache = options.get('query_cache')
+        options['verbose'] = False
+        options['batch'] = False
+        options['corpus_view'] = ir_system.LazyCorpusView(corpus, **options) # preprocessed at most once for all the models
+        shared = ir_system.IRSystem(corpus, [], **options)
+        inverted_index = None
+        self.systems = dict() # model name -> information retrieval system
+        for name, model_class in ir_batch.select_models(list(models)):
+            if model_class in (ir_system.IRBoolean, ir_system.IR_BM25):
+               if inverted_index is None:
+                  inverted_index = shared.build_inverted_index(corpus)
+               self.systems[name] = model_class(corpus, [], index=inverted_index, **options)
+            else:
+               self.systems[name] = model_class(corpus, [], **options)
+
+    #################################################################################
+    ## @brief   models
+    #  @details This method returns the names of the models of the searcher.
+    #################################################################################
+    def models(self):
+        return [name for name, model_id, model_class in ir_batch.MODELS if name in self.systems]
+
+    #################################################################################
+    ## @brief   search
+    #  @details This method ranks the query with the model and returns the (document
+    #           id, score) of the top k documents.
+    #  @param   query Query written in Natural Language.
+    #  @param   model The name of the model.
+    #  @param   k Number of documents returned (None returns all of them).
+    #################################################################################
+    def search(self, query, model, k=DEFAULT_K):
+        system = self.systems.get(model)
+        if system is None:
+           raise ValueError("Unknown model: %s (available: %s)" % (model, ", ".join(self.models())))
+        ids, scores = system.search(query, k)
+        if self.doc_ids is None:
+           return list(zip(ids.tolist(), scores.tolist()))
+        return [(self.doc_ids[doc], score) for doc, score in zip(ids.tolist(), scores.tolist())]
+
+    #################################################################################
+    ## @brief   get_executor
+    #  @details This method returns the thread pool of the searcher. It is created the
+    #           first time it is requested.
+    #################################################################################
+    def get_executor(self):
+        if self.executor is None:
+           if ThreadPoolExecutor is None:
+              raise RuntimeError("The thread pool needs concurrent.futures (the futures package on Python 2)")
+           self.executor = ThreadPoolExecutor(self.workers)
+        return self.executor
+
+    #################################################################################
+    ## @brief   search_many
+    #  @details This method ranks the queries in the thread pool and returns their
+    #           rankings in the order of the queries.
+    #  @param   queries List of queries written in Natural Language.
+    #  @param   model The name of the model.
+    #  @param   k Number of documents returned per query.
+    #################################################################################
+    def search_many(self, queries, model, k=DEFAULT_K):
+        return list(self.get_executor().map(lambda query: self.search(query, model, k), queries))
+
+    #################################################################################
+    ## @brief   search_async
+    #  @details This method ranks the query in the thread pool and returns an asyncio
+    #           future of its ranking, so the event loop is not blocked by the scoring:
+    #           ranking = await searcher.search_async(query, 'tf_idf')
+    #  @param   query Query written in Natural Language.
+    #  @param   model The name of the model.
+    #  @param   k Number of documents returned.
+    #  @param   loop The event loop (by default, the loop of the calling coroutine).
+    #################################################################################
+    def search_async(self, query, model, k=DEFAULT_K, loop=None):
+        if asyncio is None:
+           raise RuntimeError("search_async needs asyncio (Python 3)")
+        if loop is None:
+           loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.get_executor(), self.search, query, model, k)
+
+    #################################################################################
+    ## @brief   num_docs
+    #  @details This method returns the number of documents of the collection, from
+    #           their ids or from the index of a model (the corpus may be streamed).
+    #################################################################################
+    def num_docs(self):
+        if self.doc_ids is not None:
+           return len(self.doc_ids)
+        system = self.systems[self.models()[0]]
+        if isinstance(system, (ir_system.IRBoolean, ir_system.IR_BM25)):
+           return system.inverted_index.num_docs
+        return len(system.index.bow)
+
+    #################################################################################
+    ## @brief   stats
+    #  @details This method returns the models of the searcher and the counters of the
+    #           query cache.
+    #################################################################################
+    def stats(self):
+        return {'models': self.models(), 'num_docs': self.num_docs(), 'workers': self.workers,
+                'query_cache': None if self.query_cache is None else self.query_cache.stats()}
+
+    #################################################################################
+    ## @brief   close
+    #  @details This method stops the threads of the pool.
+    #################################################################################
+    def close(self):
+        if self.executor is not None:
+           self.executor.shutdown()
+           self.executor = None
+
+###################################################################################
+## @class   SearchHandler
+#  @brief   This class answers the HTTP requests of the endpoint:
+#           GET /search?q=...&model=...&k=... returns the ranking as JSON and
+#           GET /stats returns the models and the counters of the query cache.
+###################################################################################
+class SearchHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/stats':
+           return self.send_json(200, self.server.searcher.stats())
+        if url.path != '/search':
+           return self.send_json(404, {'error': "Unknown path: " + url.path})
+        query = params.get('q', [''])[0]
+        model = params.get('model', [self.server.default_model])[0]
+        try:
+            k = int(params.get('k', [DEFAULT_K])[0])
+        except ValueError:
+            return self.send_json(400, {'error': "k must be an integer"})
+        if k < 0:
+           return self.send_json(400, {'error': "k must not be negative"})
+        if not query.strip():
+           return self.send_json(400, {'error': "The query (q) is empty"})
+        start = time.time()
+        try:
+            ranking = self.server.searcher.search(query, model, k)
+        except ValueError as error:
+            return self.send_json(400, {'error': str(error)})
+        self.send_json(200, {'query': query, 'model': model, 'k': k, 'milliseconds': 1000 * (time.time() - start),
+                             'results': [{'doc_id': doc, 'score': score} for doc, score in ranking]})
+
+    def send_json(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+           BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class SearchServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True # a thread per request
+
+#################################################################################
+## @brief   make_server
+#  @details This method returns the HTTP server of the searcher (one thread per
+#           request); serve_forever() starts it.
+#  @param   searcher The searcher.
+#  @param   host The address of the server (by default, only local connections).
+#  @param   port The port of the server (0 chooses a free port).
+#  @param   default_model The model of the requests without model.
+#  @param   verbose If True, the requests are logged.
+#################################################################################
+def make_server(searcher, host='127.0.0.1', port=8000, default_model=None, verbose=False):
+    server = SearchServer((host, port), SearchHandler)
+    server.searcher = searcher
+    server.default_model = default_model or searcher.models()[0]
+    server.verbose = verbose
+    return server
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Serve the queries of the information retrieval models over HTTP.")
+    parser.add_argument('--corpus', required=True, help="corpus file (MED format or JSON lines, optionally gzipped)")
+    parser.add_argument('--models', nargs='+', default=['tf_idf'], help="names or ids of the models (default: tf_idf)")
+    parser.add_argument('--host', default='127.0.0.1', help="address of the server (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8000, help="port of the server (default: 8000)")
+    parser.add_argument('--index-dir', help="directory where the indexes are stored and reloaded from")
+    parser.add_argument('--cache-size', type=int, default=query_cache.DEFAULT_MAX_ENTRIES,
+                        help="rankings kept in the query cache, 0 disables it (default: %d)" % query_cache.DEFAULT_MAX_ENTRIES)
+    parser.add_argument('--cache-ttl', type=float, help="seconds a ranking is kept in the query cache (default: no limit)")
+    parser.add_argument('--verbose', action='store_true', help="log the requests")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_arguments(argv)
+    doc_ids, corpus = corpus_reader.read_corpus(args.corpus)
+    cache = query_cache.QueryCache(args.cache_size, args.cache_ttl) if args.cache_size > 0 else None
+    try:
+        searcher = Searcher(corpus, args.models, doc_ids, index_dir=args.index_dir, query_cache=cache)
+    except ValueError as error:
+        print(str(error))
+        return 2
+    server = make_server(searcher, args.host, args.port, verbose=args.verbose)
+    print("Serving %s on http://%s:%d/search?q=...&model=...&k=..." % (", ".join(searcher.models()), args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        searcher.close()
+    return 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
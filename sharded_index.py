@@ -0,0 +1,139 @@
+###################################################################################
+## @file      sharded_index.py
+#  @brief     The sharded_index.py stores the similarity index as fixed-size shards
+#             on disk. Each shard is memory-mapped and scored independently, so the
+#             resident memory is bounded by the shard size and not by the corpus size.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import numpy as np
+import scipy.sparse
+import json
+import os
+
+DEFAULT_SHARD_SIZE = 16384 # documents per shard
+
+###################################################################################
+## @class   ShardedSimilarity
+#  @brief   This class represents a similarity index split into shards. Every shard
+#           holds the L2-normalised vectors of consecutive documents, as a dense
+#           .npy matrix or as the .npy arrays of a CSR matrix. New documents are
+#           appended as new shards, existing shards are never rewritten. Every
+#           shard keeps its own number of features, so the dictionary can grow
+#           after a shard has been written.
+###################################################################################
+class ShardedSimilarity(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @details This method opens the shards stored in the directory, or prepares an
+    #           empty index if there are none.
+    #  @param   directory The directory of the shards.
+    #  @param   num_features The number of features of the vectors.
+    #  @param   shard_size The maximum number of documents of each shard.
+    #  @param   sparse If True, the shards are stored as CSR matrices.
+    #################################################################################
+    def __init__(self, directory, num_features=None, shard_size=DEFAULT_SHARD_SIZE, sparse=False):
+        self.directory = directory
+        self.opened = dict() # shard name -> memory-mapped matrix
+        metadata_path = os.path.join(directory, 'shards.json')
+        if os.path.exists(metadata_path):
+           with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+           self.num_features = metadata['num_features']
+           self.shard_size = metadata['shard_size']
+           self.sparse = metadata['sparse']
+           self.shards = metadata['shards']
+        else:
+           self.num_features = num_features
+           self.shard_size = shard_size
+           self.sparse = sparse
+           self.shards = [] # list of [name, offset, num_docs, num_features]
+
+    def __len__(self):
+        if len(self.shards) == 0:
+           return 0
+        name, offset, num_docs, num_features = self.shards[-1]
+        return offset + num_docs
+
+    #################################################################################
+    ## @brief   clear
+    #  @details This method removes all the shards of the directory.
+    #################################################################################
+    def clear(self):
+        for name, offset, num_docs, num_features in self.shards:
+            for path in self.shard_files(name):
+                if os.path.exists(path):
+                   os.remove(path)
+        self.shards = []
+        self.opened = dict()
+        self.save_metadata()
+
+    def shard_files(self, name):
+        if self.sparse:
+           return [os.path.join(self.directory, name + '.' + part + '.npy') for part in ('data', 'indices', 'indptr')]
+        return [os.path.join(self.directory, name + '.npy')]
+
+    def save_metadata(self):
+        if not os.path.exists(self.directory):
+           os.makedirs(self.directory)
+        metadata = {'num_features': self.num_features, 'shard_size': self.shard_size,
+                    'sparse': self.sparse, 'shards': self.shards}
+        metadata_path = os.path.join(self.directory, 'shards.json')
+        with open(metadata_path + '.tmp', 'w') as metadata_file:
+             json.dump(metadata, metadata_file)
+        if os.path.exists(metadata_path):
+           os.remove(metadata_path)
+        os.rename(metadata_path + '.tmp', metadata_path)
+
+    #################################################################################
+    ## @brief   add_documents
+    #  @details This method appends the documents to the index as new shards.
+    #  @param   matrix The CSR matrix with the L2-normalised document vectors.
+    #################################################################################
+    def add_documents(self, matrix):
+        if not os.path.exists(self.directory):
+           os.makedirs(self.directory)
+        for start in range(0, matrix.shape[0], self.shard_size):
+            rows = matrix[start:start + self.shard_size]
+            name = 'shard_%05d' % len(self.shards)
+            if self.sparse:
+               rows = rows.tocsr()
+               for path, array in zip(self.shard_files(name), (rows.data, rows.indices, rows.indptr)):
+                   np.save(path, array)
+            else:
+               np.save(self.shard_files(name)[0], rows.toarray().astype(np.float32))
+            self.shards.append([name, len(self), rows.shape[0], rows.shape[1]])
+        self.num_features = max(self.num_features, matrix.shape[1])
+        self.save_metadata()
+
+    #################################################################################
+    ## @brief   open_shard
+    #  @details This method returns the memory-mapped matrix of the shard.
+    #################################################################################
+    def open_shard(self, name, num_docs, num_features):
+        shard = self.opened.get(name)
+        if shard is None:
+           arrays = [np.load(path, mmap_mode='r') for path in self.shard_files(name)]
+           if self.sparse:
+              shard = scipy.sparse.csr_matrix(tuple(arrays), shape=(num_docs, num_features))
+           else:
+              shard = arrays[0]
+           self.opened[name] = shard
+        return shard
+
+    #################################################################################
+    ## @brief   score_blocks
+    #  @details This method scores the queries against one shard at a time and yields
+    #           the id of the first document of the shard and the block of scores
+    #           (queries x documents of the shard). The features added after the shard
+    #           was written have weight 0 in its documents, so they are not scored.
+    #  @param   queries The CSR matrix with the L2-normalised query vectors.
+    #################################################################################
+    def score_blocks(self, queries):
+        for name, offset, num_docs, num_features in self.shards:
+            shard = self.open_shard(name, num_docs, num_features)
+            shard_queries = queries[:, :num_features]
+            if self.sparse:
+               yield offset, shard.dot(shard_queries.T).T.toarray()
+            else:
+               yield offset, np.dot(shard, shard_queries.toarray().T).T
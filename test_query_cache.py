@@ -0,0 +1,81 @@
+###################################################################################
+## @file      test_query_cache.py
+#  @brief     The test_query_cache.py checks that a query cache shared by several
+#             information retrieval systems never returns the rankings of another
+#             index: other hyperparameters, other collections, documents added to
+#             the index. Run with python -m unittest test_query_cache
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+import os
+import shutil
+import tempfile
+import unittest
+import corpus_reader
+import ir_system
+import query_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class SharedQueryCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.doc_ids, cls.corpus = corpus_reader.read_corpus(os.path.join(HERE, 'corpus', 'MED.ALL'))
+        cls.query_ids, cls.queries = corpus_reader.read_corpus(os.path.join(HERE, 'queries', 'MED.QRY'))
+        cls.queries = cls.queries[:5]
+
+    def assertUncached(self, ir, cache):
+        ir.query_cache = None # rank the queries again against the index of the system
+        for query_id, q in enumerate(self.queries):
+            ids, scores = ir.search(q, 10)
+            self.assertEqual([doc for doc, score in ir.ranking_query[query_id]], ids.tolist())
+        ir.query_cache = cache
+
+    def test_hyperparameters(self):
+        cache = query_cache.QueryCache()
+        first = ir_system.IR_Lsi(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, model_params={'num_topics': 5})
+        second = ir_system.IR_Lsi(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, model_params={'num_topics': 50})
+        self.assertEqual(cache.hits, 0)
+        self.assertNotEqual(first.ranking_query, second.ranking_query)
+        self.assertUncached(second, cache)
+
+    def test_quantized_index(self):
+        cache = query_cache.QueryCache()
+        ir_system.IR_tf_idf(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, backend='dense')
+        quantized = ir_system.IR_tf_idf(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, quantize='int8')
+        self.assertEqual(cache.hits, 0)
+        self.assertUncached(quantized, cache)
+
+    def test_bm25_collections(self):
+        cache = query_cache.QueryCache()
+        half = len(self.corpus) // 2
+        ir_system.IR_BM25(self.corpus[:half], self.queries, top_k=10, verbose=False, query_cache=cache)
+        second = ir_system.IR_BM25(self.corpus[half:], self.queries, top_k=10, verbose=False, query_cache=cache)
+        self.assertEqual(cache.hits, 0)
+        self.assertUncached(second, cache)
+
+    def test_added_documents(self):
+        cache = query_cache.QueryCache()
+        ir = ir_system.IR_tf_idf(self.corpus, [], verbose=False, query_cache=cache)
+        ids, scores = ir.search('zzqq heart', 3)
+        new = ir.add_documents(ir.index, ['zzqq heart attack'])
+        ids, scores = ir.search('zzqq heart', 3)
+        self.assertEqual(ids[0], new[0])
+
+    def test_saved_index(self):
+        index_dir = tempfile.mkdtemp()
+        try:
+            cache = query_cache.QueryCache()
+            built = ir_system.IR_tf_idf(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, backend='dense', index_dir=index_dir)
+            loaded = ir_system.IR_tf_idf(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, backend='dense', index_dir=index_dir)
+            self.assertEqual(cache.hits, len(self.queries)) # the same index, loaded from disk
+            self.assertEqual(built.ranking_query, loaded.ranking_query)
+            rebuilt = ir_system.IR_tf_idf(self.corpus, self.queries, top_k=10, verbose=False, query_cache=cache, backend='dense',
+                                          quantize='float16', index_dir=index_dir)
+            self.assertEqual(cache.hits, len(self.queries)) # the stale index is rebuilt
+            self.assertUncached(rebuilt, cache)
+        finally:
+            shutil.rmtree(index_dir)
+
+if __name__ == '__main__':
+   unittest.main()
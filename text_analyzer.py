@@ -0,0 +1,104 @@
+###################################################################################
+## @file      text_analyzer.py
+#  @brief     The text_analyzer.py turns documents and queries into the taxonomy of
+#             keywords used by the information retrieval models.
+#  @authors   Yolanda de la Hoz Simon
+###################################################################################
+from nltk.tokenize import wordpunct_tokenize
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+from collections import OrderedDict
+import threading
+
+###################################################################################
+## @class   TextAnalyzer
+#  @brief   This class represents the text analysis pipeline, i.e., tokenization,
+#           stopwords removal and stemming. The stopwords and the stemmer are loaded
+#           once and the stems of the tokens are memoized in a bounded LRU cache,
+#           which can be shared by several threads.
+###################################################################################
+class TextAnalyzer(object):
+
+    #################################################################################
+    ## @brief   Constructor
+    #  @details This method loads the stopwords and the stemmer.
+    #  @param   language The language of the stopwords.
+    #  @param   min_length The minimum length of the tokens kept.
+    #  @param   cache_size The maximum number of stems memoized.
+    #################################################################################
+    def __init__(self, language='english', min_length=3, cache_size=100000):
+        self.language = language
+        self.min_length = min_length
+        self.cache_size = cache_size
+        self.stopset = frozenset(stopwords.words(language))
+        self.stemmer = PorterStemmer()
+        self.stems = OrderedDict() # token -> stem, ordered from least to most recently used
+        self.lock = threading.Lock()
+
+    def __getstate__(self): # the lock is not sent to the indexing processes
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    #################################################################################
+    ## @brief   stem
+    #  @details This method returns the stem of the token, memoized in the LRU cache.
+    #           The token is stemmed outside the lock.
+    #  @param   token The token in lower case.
+    #################################################################################
+    def stem(self, token):
+        with self.lock:
+             stem = self.stems.pop(token, None)
+             if stem is not None:
+                self.stems[token] = stem
+                return stem
+        stem = self.stemmer.stem(token)
+        with self.lock:
+             self.stems.pop(token, None)
+             while len(self.stems) >= self.cache_size and len(self.stems) > 0:
+                 self.stems.popitem(last=False) # evict the least recently used token
+             self.stems[token] = stem
+        return stem
+
+    #################################################################################
+    ## @brief   analyze
+    #  @details This method return the taxonomy of keywords for the given document.
+    #  @param   doc The document to be analyzed
+    #################################################################################
+    def analyze(self, doc):
+        tokens = [token.lower() for token in wordpunct_tokenize(doc)] # split text on whitespace and punctuation
+        return [self.stem(token) for token in tokens if token not in self.stopset and len(token) >= self.min_length]
+
+    #################################################################################
+    ## @brief   analyze_many
+    #  @details This method return the taxonomy of keywords for each document.
+    #  @param   docs The documents to be analyzed
+    #################################################################################
+    def analyze_many(self, docs):
+        analyze = self.analyze
+        return [analyze(doc) for doc in docs]
+
+    #################################################################################
+    ## @brief   settings
+    #  @details This method returns the settings of the pipeline, stored in the index
+    #           manifest to detect indexes built with another preprocessing.
+    #################################################################################
+    def settings(self):
+        return {'tokenizer': 'wordpunct', 'stopwords': self.language, 'min_length': self.min_length, 'stemmer': 'porter'}
+
+_default_analyzer = None
+
+#################################################################################
+## @brief   default_analyzer
+#  @details This method returns the analyzer shared by the information retrieval
+#           models. It is created the first time it is requested.
+#################################################################################
+def default_analyzer():
+    global _default_analyzer
+    if _default_analyzer is None:
+       _default_analyzer = TextAnalyzer()
+    return _default_analyzer